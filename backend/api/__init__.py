@@ -1,7 +1,12 @@
 import os
+from dotenv import load_dotenv
 from flask import Flask
 from flask_cors import CORS
 
+# Load backend/.env once, before any module reads its configuration from the environment
+# at import time (every entry point imports this package first)
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env"))
+
 # Resolve the absolute path to the static (frontend) folder
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 STATIC_FOLDER = os.path.join(BASE_DIR, "public")
@@ -13,6 +18,14 @@ app = Flask(
     static_url_path=""  # serve static files from root "/"
 )
 
+# Behind a reverse proxy, take the client address from X-Forwarded-For so per-client
+# rate limits see real clients rather than the proxy
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+if TRUSTED_PROXY_HOPS:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
 # Enable CORS for all /api/* routes (can restrict origins if needed)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
@@ -0,0 +1,171 @@
+import ipaddress
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from api.shared_state import shared, SHARED_STATE_ENABLED
+
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", "16"))
+MAX_QUEUED_GENERATIONS = int(os.getenv("MAX_QUEUED_GENERATIONS", "64"))
+QUEUE_TIMEOUT = float(os.getenv("GENERATION_QUEUE_TIMEOUT", "30"))
+CLIENT_RATE_PER_MINUTE = float(os.getenv("CLIENT_GENERATIONS_PER_MINUTE", "10"))
+CLIENT_BURST = float(os.getenv("CLIENT_GENERATION_BURST", "5"))
+FORCE_RATE_PER_MINUTE = float(os.getenv("CLIENT_FORCE_PER_MINUTE", "2"))
+FORCE_BURST = float(os.getenv("CLIENT_FORCE_BURST", "2"))
+MAX_TRACKED_CLIENTS = 10000
+
+
+class AdmissionRejected(Exception):
+    """Raised when a generation is refused; carries the Retry-After hint in seconds."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Take one token; returns 0 on success or the seconds until a token is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else QUEUE_TIMEOUT
+
+
+class AdmissionController:
+    """
+    Limits expensive generations: a global concurrency limit with a bounded wait queue,
+    plus per-client token buckets and a stricter separate budget for force=true requests.
+
+    Client buckets live in shared state (when enabled) so budgets hold across all worker
+    processes; the concurrency limit and queue apply per process.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_GENERATIONS, max_queue=MAX_QUEUED_GENERATIONS,
+                 queue_timeout=QUEUE_TIMEOUT, client_rate=CLIENT_RATE_PER_MINUTE, client_burst=CLIENT_BURST,
+                 force_rate=FORCE_RATE_PER_MINUTE, force_burst=FORCE_BURST, shared_buckets=SHARED_STATE_ENABLED):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.client_rate = client_rate / 60
+        self.client_burst = client_burst
+        self.force_rate = force_rate / 60
+        self.force_burst = force_burst
+        self.shared_buckets = shared_buckets
+        self.active = 0
+        self.waiting = 0
+        self._buckets = OrderedDict()  # (client_id, kind) -> TokenBucket
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+
+    def check_rate(self, client_id, force=False):
+        """Charge the client's budget, raising AdmissionRejected when it is exhausted."""
+        kind, rate, burst = ("force", self.force_rate, self.force_burst) if force else \
+            ("generate", self.client_rate, self.client_burst)
+        if self.shared_buckets:
+            wait = _take_shared(f"{client_id}:{kind}", rate, burst)
+            if wait:
+                raise AdmissionRejected(f"Rate limit exceeded for {kind} requests", wait)
+            return
+        with self._lock:
+            bucket = self._buckets.pop((client_id, kind), None) or TokenBucket(rate, burst)
+            self._buckets[(client_id, kind)] = bucket
+            while len(self._buckets) > MAX_TRACKED_CLIENTS:
+                self._buckets.popitem(last=False)
+            wait = bucket.take()
+        if wait:
+            raise AdmissionRejected(f"Rate limit exceeded for {kind} requests", wait)
+
+    def acquire(self):
+        """Take a global generation slot, queueing up to queue_timeout seconds."""
+        with self._lock:
+            if self.active < self.max_concurrent:
+                self.active += 1
+                return
+            if self.waiting >= self.max_queue:
+                raise AdmissionRejected("Generation queue is full", self.queue_timeout)
+            self.waiting += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise AdmissionRejected("Timed out waiting for a generation slot", self.queue_timeout)
+                    self._slot_freed.wait(remaining)
+                self.active += 1
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+            self._slot_freed.notify()
+
+    @contextmanager
+    def slot(self):
+        """Hold a generation slot for the duration of the block, without charging a client."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def admit(self, client_id, force=False):
+        """Charge the client's budget and hold a generation slot for the duration of the block."""
+        self.check_rate(client_id, force)
+        with self.slot():
+            yield
+
+
+def client_key(address):
+    """
+    Rate-limit key for a remote address. IPv6 clients usually control a whole /64, so
+    addresses are grouped by that prefix rather than giving each one its own budget.
+    """
+    try:
+        ip = ipaddress.ip_address(address)
+    except (TypeError, ValueError):
+        return address or "anonymous"
+    if ip.version == 6:
+        if ip.ipv4_mapped:
+            return str(ip.ipv4_mapped)
+        return str(ipaddress.ip_network(f"{ip}/64", strict=False))
+    return str(ip)
+
+
+def _take_shared(key, rate, burst):
+    """TokenBucket.take() on a bucket stored in shared state; returns 0 or the seconds to wait."""
+    result = {}
+
+    def take(state):
+        now = time.time()
+        tokens, updated = state or (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            result["wait"] = 0
+            tokens -= 1
+        else:
+            result["wait"] = (1 - tokens) / rate if rate > 0 else QUEUE_TIMEOUT
+        return [tokens, now]
+
+    # A bucket left alone this long is full again, so it can expire
+    refill = burst / rate if rate > 0 else QUEUE_TIMEOUT
+    shared.update("rate-limits", key, take, ttl=refill)
+    return result["wait"]
+
+
+admission = AdmissionController()
@@ -0,0 +1,114 @@
+"""
+Batch generation for many (topic, material) pairs in one request.
+
+Pairs are deduplicated, served from storage where possible, and the rest are generated
+concurrently on a shared pool. A batch that needs any generation is charged to the
+client's rate budget once, like a single request, so a course-sized batch is not cut off
+by the per-request burst; if the client is over budget, every pair that needed generating
+comes back "rejected" with a retry_after hint. The generations themselves are bounded by
+the batch pool and the global admission slots, which every upstream call still takes.
+Identical generations already in flight elsewhere in the process are joined rather than repeated.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+
+from api.admission import admission, AdmissionRejected
+from api.materials import GENERATORS, generate_once, load_cached, material_etag
+import profiling
+
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "200"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+
+
+def parse_items(items):
+    """
+    Validate and deduplicate a list of {"topic", "material"} pairs, keeping request order.
+
+    Raises:
+        ValueError: If the list is empty, too long or contains an invalid pair.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("items must be a non-empty list")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise ValueError(f"A batch may contain at most {MAX_BATCH_ITEMS} items")
+
+    pairs = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError("Each item must be an object with topic and material")
+        topic = str(item.get("topic", "")).strip()
+        material = str(item.get("material", "")).strip()
+        if not topic:
+            raise ValueError("Each item needs a topic")
+        if material not in GENERATORS:
+            raise ValueError(f"Unknown material: {material}")
+        pairs.setdefault((topic.lower(), material), (topic, material))
+    return list(pairs.values())
+
+
+def _run_item(topic, material, study_data):
+    content, shared = generate_once(topic, material, study_data)
+    return content, "SHARED" if shared else "MISS"
+
+
+def _ok(topic, material, content, cache):
+    return {"topic": topic, "material": material, "status": "ok", "cache": cache,
+            "etag": material_etag(content), "content": content}
+
+
+def run_batch(pairs, study_data, client, force=False):
+    """
+    Yield one result dict per pair.
+
+    Cache hits are read inline and come back first without touching the pool. The first
+    pair that needs generating charges the batch to the client's budget once (the force
+    budget with force=True); if that is refused, every pair that needs generating yields a
+    "rejected" result with the same retry_after. Generated pairs follow in completion order,
+    and failed pairs yield an error result rather than ending the stream.
+    """
+    futures = {}
+    charged, rejected = False, None
+    try:
+        for topic, material in pairs:
+            cached = None if force else load_cached(topic, material)
+            if cached is not None:
+                yield _ok(topic, material, cached, "HIT")
+                continue
+            if not charged:
+                charged = True
+                try:
+                    admission.check_rate(client, force)
+                except AdmissionRejected as e:
+                    rejected = e
+            if rejected is not None:
+                yield {"topic": topic, "material": material, "status": "rejected",
+                       "error": rejected.reason, "retry_after": rejected.retry_after}
+                continue
+            future = _executor.submit(copy_context().run, profiling.run, _run_item, topic, material, study_data)
+            futures[future] = (topic, material)
+
+        for future in as_completed(futures):
+            topic, material = futures[future]
+            try:
+                content, cache = future.result()
+                yield _ok(topic, material, content, cache)
+            except AdmissionRejected as e:
+                yield {"topic": topic, "material": material, "status": "rejected",
+                       "error": e.reason, "retry_after": e.retry_after}
+            except Exception as e:
+                print(f"❌ Batch generation of {topic}/{material} failed: {e}")
+                yield {"topic": topic, "material": material, "status": "error", "error": str(e)}
+    finally:
+        # Client went away: drop work that has not started yet
+        for future in futures:
+            future.cancel()
+
+
+def stream_ndjson(pairs, study_data, client, force=False):
+    """Serialize run_batch results as NDJSON lines."""
+    for result in run_batch(pairs, study_data, client, force):
+        yield json.dumps(result) + "\n"
@@ -0,0 +1,187 @@
+"""
+Bulk NDJSON export and import of the stored_materials corpus.
+
+Each line is one record: {"topic": ..., "material": ..., "content": ...}.
+Imports validate every record, upsert in batches grouped by topic across a thread
+pool, and checkpoint the input offset after each batch so an interrupted run resumes.
+Imports are idempotent: a record whose content equals the material's latest version is
+counted as unchanged rather than stored again, and a (topic, material) repeated within
+a batch is reported, with the last record winning.
+
+Usage:
+    python -m api.bulk export --output corpus.ndjson
+    python -m api.bulk import corpus.ndjson [--workers 8] [--batch-size 500] [--restart]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import api.storage_utils as storage_utils
+from api.storage import topic_registry
+
+MATERIAL_PATTERN = re.compile(r"^[a-z_]{1,32}$")
+INVALID_TOPIC_CHARS = re.compile(r"[\\/\x00]")
+MAX_TOPIC_LENGTH = 200
+
+
+def export_ndjson(topics=None):
+    """
+    Yield one NDJSON line per (topic, material), loading one topic at a time. Topics are
+    written as first registered ("Cell Biology"), not as their lowercased file names.
+    """
+    names = {topic.lower(): topic for topic in topic_registry.all()}
+    for topic in topics or storage_utils.iter_topics():
+        data = storage_utils.load_material(topic, touch=False)
+        name = names.get(topic.strip().lower(), topic)
+        for material, content in (data or {}).items():
+            if not isinstance(content, str):
+                continue
+            yield json.dumps({"topic": name, "material": material, "content": content}) + "\n"
+
+
+def validate_record(record):
+    """
+    Check an import record.
+
+    Returns:
+        str: An error description, or None if the record is valid.
+    """
+    if not isinstance(record, dict):
+        return "record is not an object"
+    topic, material, content = record.get("topic"), record.get("material"), record.get("content")
+    if not isinstance(topic, str) or not topic.strip() or topic in (".", ".."):
+        return "missing topic"
+    if len(topic) > MAX_TOPIC_LENGTH or INVALID_TOPIC_CHARS.search(topic):
+        return "invalid topic name"
+    if not isinstance(material, str) or not MATERIAL_PATTERN.match(material):
+        return "invalid material"
+    if not isinstance(content, str):
+        return "content must be a string"
+    return None
+
+
+def _progress_path(path):
+    return f"{path}.progress"
+
+
+def _load_progress(path):
+    try:
+        with open(_progress_path(path)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return _new_progress()
+
+
+def _new_progress():
+    return {"offset": 0, "imported": 0, "unchanged": 0, "duplicates": 0, "invalid": 0}
+
+
+def _save_progress(path, progress):
+    tmp_path = f"{_progress_path(path)}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, _progress_path(path))
+
+
+def _upsert_batch(executor, batch, progress):
+    """
+    Upsert a batch with one storage write per topic; topics run in parallel, and each
+    topic is registered once so it shows up in topic listings.
+    Adds the batch's imported, unchanged and duplicate counts to progress.
+    """
+    by_topic = defaultdict(dict)
+    for record in batch:
+        topic, material = record["topic"].strip(), record["material"]
+        if material in by_topic[topic]:
+            progress["duplicates"] += 1
+            print(f"⚠️ Duplicate record for {topic!r}/{material} in one batch; keeping the last",
+                  file=sys.stderr)
+        by_topic[topic][material] = record["content"]
+    futures = {executor.submit(storage_utils.save_materials, topic, materials, skip_unchanged=True): len(materials)
+               for topic, materials in by_topic.items()}
+    for future, submitted in futures.items():
+        saved = len(future.result())
+        progress["imported"] += saved
+        progress["unchanged"] += submitted - saved
+    for topic in by_topic:
+        topic_registry.add(topic)
+
+
+def import_ndjson(path, workers=8, batch_size=500, restart=False):
+    """
+    Import an NDJSON file into storage, resuming from the last checkpoint unless restart is set.
+
+    Returns:
+        dict: Progress counters {"offset", "imported", "unchanged", "duplicates", "invalid"}.
+    """
+    progress = _new_progress() if restart else {**_new_progress(), **_load_progress(path)}
+
+    with open(path, "rb") as f, ThreadPoolExecutor(max_workers=workers) as executor:
+        f.seek(progress["offset"])
+        batch = []
+        offset = progress["offset"]
+        for raw in f:
+            offset += len(raw)
+            if not raw.strip():
+                continue
+            try:
+                record = json.loads(raw)
+                error = validate_record(record)
+            except ValueError as e:
+                error = f"invalid JSON: {e}"
+            if error:
+                progress["invalid"] += 1
+                print(f"⚠️ Skipping record at byte {offset - len(raw)}: {error}", file=sys.stderr)
+                continue
+
+            batch.append(record)
+            if len(batch) >= batch_size:
+                _upsert_batch(executor, batch, progress)
+                progress["offset"] = offset
+                _save_progress(path, progress)
+                batch = []
+
+        if batch:
+            _upsert_batch(executor, batch, progress)
+        progress["offset"] = offset
+        _save_progress(path, progress)
+
+    storage_utils.enforce_storage_quota(force=True)
+    return progress
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk NDJSON export/import of stored materials.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = commands.add_parser("export")
+    export_cmd.add_argument("--output", help="File to write (default stdout)")
+    export_cmd.add_argument("--topic", action="append", help="Topic to export (repeatable; default all)")
+
+    import_cmd = commands.add_parser("import")
+    import_cmd.add_argument("path")
+    import_cmd.add_argument("--workers", type=int, default=8)
+    import_cmd.add_argument("--batch-size", type=int, default=500)
+    import_cmd.add_argument("--restart", action="store_true", help="Ignore any saved checkpoint")
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            for line in export_ndjson(args.topic):
+                out.write(line)
+        finally:
+            if args.output:
+                out.close()
+    else:
+        progress = import_ndjson(args.path, args.workers, args.batch_size, args.restart)
+        print(f"✅ Imported {progress['imported']} record(s); {progress['unchanged']} unchanged, "
+              f"{progress['duplicates']} duplicate(s) within a batch, {progress['invalid']} invalid", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
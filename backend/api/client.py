@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_BASE_URL = os.getenv("STUDY_BUDDY_API_URL", "http://127.0.0.1:8000")
+CONNECT_TIMEOUT = float(os.getenv("STUDY_BUDDY_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("STUDY_BUDDY_READ_TIMEOUT", "120"))
+
+
+class StudyBuddyClient:
+    """
+    Shared HTTP client for the Study Buddy API with keep-alive connection pooling,
+    concurrent multi-route fetches and ETag-based conditional requests.
+    """
+
+    def __init__(self, base_url=None, timeout=None, pool_size=10):
+        """
+        Args:
+            base_url (str): Server root, e.g. "http://127.0.0.1:8000" (default STUDY_BUDDY_API_URL).
+            timeout (tuple): (connect, read) timeouts in seconds.
+            pool_size (int): Maximum pooled connections per host.
+        """
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip("/") + "/"
+        self.timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(connect=2, backoff_factor=0.3, allowed_methods=["GET"]),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._cache = {}  # (route, topic) -> (etag, text)
+        self._cache_lock = threading.Lock()
+
+    def url(self, route):
+        return urljoin(self.base_url, f"api/{route.lstrip('/')}")
+
+    def get(self, route, topic=None, progress_id=None, **params):
+        """
+        GET an API route, reusing the cached body when the server answers 304 Not Modified.
+        With progress_id, step events for the request can be read via progress_events().
+
+        Returns:
+            str: The response body.
+        """
+        if topic is not None:
+            params["topic"] = topic
+        key = (route, topic)
+        headers = {"X-Progress-Id": progress_id} if progress_id else {}
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached:
+            headers["If-None-Match"] = cached[0]
+
+        res = self.session.get(self.url(route), params=params, headers=headers, timeout=self.timeout)
+        if res.status_code == 304 and cached:
+            return cached[1]
+        res.raise_for_status()
+
+        etag = res.headers.get("ETag")
+        if etag:
+            with self._cache_lock:
+                self._cache[key] = (etag, res.text)
+        return res.text
+
+    def get_json(self, route, **params):
+        res = self.session.get(self.url(route), params=params, timeout=self.timeout)
+        res.raise_for_status()
+        return res.json()
+
+    def iter_items(self, material, topic, limit=20):
+        """
+        Yield a quiz's, test's or flashcard set's parsed items, one page request at a time,
+        so callers can stop as soon as they have what they need.
+        """
+        cursor = None
+        while True:
+            params = {"topic": topic, "limit": limit, **({"cursor": cursor} if cursor else {})}
+            page = self.get_json(material, **params)
+            yield from page["items"]
+            cursor = page["next_cursor"]
+            if not cursor:
+                return
+
+    def study_pack(self, topic):
+        """Every stored material of a topic with its version vector (see api.sync)."""
+        return self.get_json("study_pack", topic=topic)
+
+    def sync(self, topic, versions):
+        """Materials and items changed since the given version vector."""
+        return self.post_json("sync", {"topic": topic, "versions": versions})
+
+    def post_json(self, route, payload, **params):
+        res = self.session.post(self.url(route), json=payload, params=params, timeout=self.timeout)
+        res.raise_for_status()
+        return res.json()
+
+    def fetch_many(self, routes, topic):
+        """
+        Fetch several routes for a topic concurrently over the pooled connections.
+
+        Returns:
+            dict: route -> response text, or the raised exception for failed routes.
+        """
+        def fetch(route):
+            try:
+                return self.get(route, topic=topic)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=min(len(routes), self.pool_size) or 1) as executor:
+            return dict(zip(routes, executor.map(fetch, routes)))
+
+    def batch(self, items, force=False):
+        """
+        Request many materials at once via /api/batch.
+
+        Args:
+            items (list): (topic, material) pairs.
+
+        Yields:
+            dict: One result per unique pair, as soon as the server finishes it.
+        """
+        payload = {"items": [{"topic": topic, "material": material} for topic, material in items]}
+        params = {"force": "true"} if force else {}
+        with self.session.post(self.url("batch"), json=payload, params=params,
+                               timeout=self.timeout, stream=True) as res:
+            res.raise_for_status()
+            for line in res.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def progress_events(self, progress_id):
+        """
+        Follow /api/progress/<id> as server-sent events until the request finishes.
+
+        Yields:
+            tuple: (event name, data dict).
+        """
+        url = self.url(f"progress/{progress_id}")
+        with self.session.get(url, stream=True, timeout=(self.timeout[0], None)) as res:
+            res.raise_for_status()
+            event, data = "message", []
+            for line in res.iter_lines(decode_unicode=True):
+                if line is None or line.startswith(":"):
+                    continue
+                if line == "":
+                    if data:
+                        yield event, json.loads("\n".join(data))
+                    event, data = "message", []
+                elif line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data.append(line[len("data:"):].strip())
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide StudyBuddyClient."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = StudyBuddyClient()
+        return _client
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from api.shared_state import shared
+
+CONTEXT_DIR = os.path.join(os.getcwd(), "stored_contexts")
+TOPIC_INDEX = os.path.join(CONTEXT_DIR, "topics.json")
+MAX_CONTEXT_BYTES = int(float(os.getenv("CONTEXT_MAX_MB", "20")) * 1024 * 1024)
+CHUNK_SIZE = 64 * 1024
+# Total size of context text kept in memory; larger contexts are read from disk on each use
+CONTEXT_CACHE_BYTES = int(float(os.getenv("CONTEXT_CACHE_MB", "64")) * 1024 * 1024)
+MAX_CACHED_CONTEXT_BYTES = CONTEXT_CACHE_BYTES // 4
+
+os.makedirs(CONTEXT_DIR, exist_ok=True)
+_index_lock = threading.Lock()
+_index_cache = {"mtime": None, "index": {}}
+_text_cache = OrderedDict()  # context hash -> (text, size in bytes)
+_text_cache_bytes = 0
+_text_cache_lock = threading.Lock()
+
+
+class ContextTooLarge(Exception):
+    """Raised when an upload exceeds MAX_CONTEXT_BYTES."""
+
+
+def _context_path(context_hash):
+    return os.path.join(CONTEXT_DIR, f"{context_hash}.txt")
+
+
+def save_context_stream(stream, max_bytes=MAX_CONTEXT_BYTES):
+    """
+    Copy an uploaded stream to disk in chunks while hashing it.
+    Identical uploads are stored once.
+
+    Args:
+        stream: A binary file-like object.
+        max_bytes (int): Upload size limit.
+
+    Returns:
+        dict: {"hash", "size", "deduplicated"}
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=CONTEXT_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ContextTooLarge(f"Context exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+
+        context_hash = digest.hexdigest()
+        path = _context_path(context_hash)
+        deduplicated = os.path.exists(path)
+        if deduplicated:
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        return {"hash": context_hash, "size": size, "deduplicated": deduplicated}
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_index():
+    """Return the topic -> context hash index, re-reading the file only when it changed."""
+    try:
+        stat = os.stat(TOPIC_INDEX)
+    except FileNotFoundError:
+        return {}
+    # Every rewrite is an os.replace, so the inode changes even when another process
+    # rewrites the index within the filesystem's timestamp granularity
+    version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if version != _index_cache["mtime"]:
+        with open(TOPIC_INDEX) as f:
+            _index_cache["index"] = json.load(f)
+        _index_cache["mtime"] = version
+    return _index_cache["index"]
+
+
+def attach_context(topic, context_hash):
+    """Attach a stored context to a topic, replacing any previous one."""
+    if not os.path.exists(_context_path(context_hash)):
+        raise KeyError(f"Unknown context {context_hash}")
+    with _index_lock, shared.lock("context-index"):
+        index = dict(_read_index())
+        index[topic.strip().lower()] = context_hash
+        tmp_path = f"{TOPIC_INDEX}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, TOPIC_INDEX)
+
+
+def get_topic_context_hash(topic):
+    """Return the hash of the context attached to a topic, or None."""
+    with _index_lock:
+        return _read_index().get(topic.strip().lower())
+
+
+def load_context(context_hash):
+    """
+    Return stored context text. Content is immutable per hash, so recently used contexts
+    are kept in memory, up to CONTEXT_CACHE_BYTES in total; a context larger than
+    MAX_CACHED_CONTEXT_BYTES is never cached and is read from disk each time.
+    """
+    global _text_cache_bytes
+    with _text_cache_lock:
+        cached = _text_cache.get(context_hash)
+        if cached is not None:
+            _text_cache.move_to_end(context_hash)
+            return cached[0]
+
+    with open(_context_path(context_hash), "rb") as f:
+        data = f.read()
+    text = data.decode("utf-8", errors="replace")
+    if len(data) > MAX_CACHED_CONTEXT_BYTES:
+        return text
+
+    with _text_cache_lock:
+        if context_hash not in _text_cache:
+            _text_cache[context_hash] = (text, len(data))
+            _text_cache_bytes += len(data)
+        while _text_cache_bytes > CONTEXT_CACHE_BYTES:
+            _, (_, size) = _text_cache.popitem(last=False)
+            _text_cache_bytes -= size
+    return text
+
+
+def get_topic_context(topic):
+    """Return the context text attached to a topic, or None if there is none."""
+    context_hash = get_topic_context_hash(topic)
+    if not context_hash or not os.path.exists(_context_path(context_hash)):
+        return None
+    return load_context(context_hash)
+
+
+def _digest_path(context_hash):
+    return os.path.join(CONTEXT_DIR, f"{context_hash}.digest.txt")
+
+
+def load_digest(context_hash):
+    """Return the cached condensed digest for a context hash, or None."""
+    path = _digest_path(context_hash)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def save_digest(context_hash, digest):
+    tmp_path = f"{_digest_path(context_hash)}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(digest)
+    os.replace(tmp_path, _digest_path(context_hash))
@@ -0,0 +1,141 @@
+"""
+Streaming exports of stored study materials.
+
+Each exporter is a generator that loads one topic at a time from storage_utils
+and yields text chunks, so memory use stays constant regardless of corpus size.
+
+Usage:
+    python -m api.export --format markdown --output course.md [--topic "Cell Biology"]
+"""
+import argparse
+import csv
+import io
+import re
+import sys
+
+import api.storage_utils as storage_utils
+from api import bulk
+from api.storage import topic_registry
+from card_parser import parse_cards
+
+MATERIAL_ORDER = ["study_content", "flashcards", "quiz", "test"]
+MATERIAL_TITLES = {
+    "study_content": "Study Content",
+    "flashcards": "Flashcards",
+    "quiz": "Quiz",
+    "test": "Test",
+}
+
+
+def resolve_topics(requested):
+    """
+    Map requested topic names to stored topics, case-insensitively.
+
+    Returns:
+        list or None: Stored topic names, or None (every topic) if none were requested.
+
+    Raises:
+        KeyError: With the first requested name that is not a stored topic.
+    """
+    requested = [t.strip() for t in requested or () if t.strip()]
+    if not requested:
+        return None
+    stored = {topic.lower(): topic for topic in storage_utils.iter_topics()}
+    resolved = []
+    for name in requested:
+        if name.lower() not in stored:
+            raise KeyError(name)
+        resolved.append(stored[name.lower()])
+    return resolved
+
+
+def _iter_materials(topics=None):
+    """
+    Yield (topic, material, content) one topic at a time. Stored files are named by the
+    lowercased topic, so topics are reported as first registered ("Cell Biology").
+    """
+    names = {topic.lower(): topic for topic in topic_registry.all()}
+    for topic in topics or storage_utils.iter_topics():
+        data = storage_utils.load_material(topic, touch=False)
+        if not data:
+            continue
+        topic = names.get(topic.strip().lower(), topic)
+        for material in MATERIAL_ORDER + sorted(set(data) - set(MATERIAL_ORDER)):
+            content = data.get(material)
+            if content and isinstance(content, str):
+                yield topic, material, content
+
+
+def export_markdown(topics=None):
+    current = None
+    for topic, material, content in _iter_materials(topics):
+        if topic != current:
+            yield f"# {topic}\n\n"
+            current = topic
+        yield f"## {MATERIAL_TITLES.get(material, material.title())}\n\n{content.strip()}\n\n"
+
+
+def _csv_row(row):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue()
+
+
+def export_csv(topics=None):
+    yield _csv_row(["topic", "material", "content"])
+    for topic, material, content in _iter_materials(topics):
+        yield _csv_row([topic, material, content])
+
+
+def export_anki(topics=None):
+    """
+    Anki's tab-separated text import format: question, answer and a topic tag per flashcard.
+    Cards are read with the shared card parser, so every flashcard format the app
+    understands is exported, not only "Q:"/"A:" pairs.
+    """
+    yield "#separator:tab\n#html:false\n#tags column:3\n"
+    for topic, material, content in _iter_materials(topics):
+        if material != "flashcards":
+            continue
+        tag = re.sub(r"\s+", "_", topic.strip())
+        for card in parse_cards(content):
+            if card["answer"]:
+                yield f"{_anki_field(card['question'])}\t{_anki_field(card['answer'])}\t{tag}\n"
+
+
+def _anki_field(text):
+    return text.replace("\t", " ").replace("\n", " ").strip()
+
+
+EXPORTERS = {
+    "markdown": (export_markdown, "text/markdown", "md"),
+    "csv": (export_csv, "text/csv", "csv"),
+    "anki": (export_anki, "text/tab-separated-values", "txt"),
+    "ndjson": (lambda topics=None: bulk.export_ndjson(topics), "application/x-ndjson", "ndjson"),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export stored study materials.")
+    parser.add_argument("--format", choices=sorted(EXPORTERS), default="markdown")
+    parser.add_argument("--output", help="File to write (default stdout)")
+    parser.add_argument("--topic", action="append", help="Topic to export (repeatable; default all)")
+    args = parser.parse_args(argv)
+
+    exporter = EXPORTERS[args.format][0]
+    try:
+        args.topic = resolve_topics(args.topic)
+    except KeyError as e:
+        parser.error(f"unknown topic: {e.args[0]}")
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        for chunk in exporter(args.topic):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+            print(f"✅ Exported {args.format} to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
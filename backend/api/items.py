@@ -0,0 +1,280 @@
+"""
+Item-level access to stored materials.
+
+Quiz and test text is split into question items and flashcards into cards, once per
+content version. The parsed items are stored next to the materials, keyed by the
+content's ETag, so paging through a material never re-parses it (or, for flashcards,
+regenerates distractors). Cursors are opaque and tied to the content version.
+"""
+import base64
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+import api.storage_utils as storage_utils
+from card_parser import CardParser
+from api.admission import admission
+from api.materials import GENERATION_LOCK_TIMEOUT, material_etag
+from api.shared_state import shared
+from flashcard_web_extraction import extract_cards_for_web_ui
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+CACHE_SIZE = 128
+PAGING_PARAMS = ("cursor", "limit", "item")
+# Question materials are parsed when they are generated; flashcards on first request,
+# since building their options calls the model for distractors
+QUESTION_MATERIALS = ("quiz", "test")
+ITEM_MATERIALS = ("flashcards", *QUESTION_MATERIALS)
+
+SECTION_LINE = re.compile(r"^\s*(?:#+\s*)?([\w\s/&-]*(?:Questions|Quiz|Test)):?\s*$", re.IGNORECASE)
+
+_cache = OrderedDict()  # (topic, material, etag) -> items
+_cache_lock = threading.Lock()
+
+
+class CursorExpired(Exception):
+    """Raised when a cursor refers to a content version that is no longer current."""
+
+
+def parse_questions(text):
+    """
+    Split quiz or test text into question items, using the shared card parser; lines
+    such as "Fill-in-the-Blank Questions:" between questions name the section.
+
+    Returns:
+        list: {"id", "section", "question", "options", "answer"} dicts in order.
+    """
+    parser = CardParser()
+    items, section = [], None
+
+    def add(cards):
+        for card in cards:
+            options = [{"key": chr(ord("A") + i), "text": option} for i, option in enumerate(card["options"])]
+            # "Answer: B" is resolved to the option's text by the parser; report its key
+            answer = next((o["key"] for o in options if o["text"] == card["answer"]), card["answer"])
+            items.append({"id": len(items) + 1, "section": card["section"], "question": card["question"],
+                          "options": options, "answer": answer})
+
+    for line in text.splitlines():
+        current = parser.current
+        header = SECTION_LINE.match(line)
+        if header and (current is None or current["options"] or current["answer"]):
+            add(parser.close())
+            section = header.group(1).strip()
+            continue
+        add(parser.feed(line + "\n"))
+        if parser.current is not None and parser.current is not current:
+            parser.current["section"] = section
+    add(parser.close())
+    return items
+
+
+def parse_items(material_type, content):
+    if material_type == "flashcards":
+        cards = extract_cards_for_web_ui(content)
+        parsed = [{"id": i, **card} for i, card in enumerate(cards, start=1)]
+    else:
+        parsed = parse_questions(content)
+    for item in parsed:
+        item["key"] = item_key(item)
+    return parsed
+
+
+def item_key(item):
+    """Stable identity of an item's content, independent of its position; used for delta sync."""
+    body = {k: v for k, v in item.items() if k not in ("id", "key")}
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _load_stored(topic, material_type, etag):
+    stored = (storage_utils._read_json(storage_utils._items_path(topic)) or {}).get(material_type)
+    if stored and stored["etag"] == etag:
+        return stored["items"]
+    return None
+
+
+def get_items(topic, material_type, content, client=None):
+    """
+    Return the parsed items for a material's content, parsing and storing them on first use.
+    Concurrent first requests (threads or processes) wait for one parse instead of each
+    running their own, which for flashcards means one distractor call per version.
+
+    Building flashcard items calls the model, so that build is admitted like a generation:
+    it is charged to client (when given) and holds a generation slot.
+
+    Raises:
+        AdmissionRejected: If flashcard items must be built and the client or server is over its limit.
+    """
+    etag = material_etag(content)
+    key = (topic.lower(), material_type, etag)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    items = _load_stored(topic, material_type, etag)
+    if items is None:
+        with shared.lock(f"items-build:{topic.lower()}:{material_type}", timeout=GENERATION_LOCK_TIMEOUT):
+            items = _load_stored(topic, material_type, etag)
+            if items is None:
+                items = _build_items(topic, material_type, content, client)
+
+    with _cache_lock:
+        _cache[key] = items
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return items
+
+
+def _build_items(topic, material_type, content, client):
+    if material_type in QUESTION_MATERIALS:
+        return store_items(topic, material_type, content)
+    with admission.admit(client) if client is not None else admission.slot():
+        return store_items(topic, material_type, content)
+
+
+def built_items(topic, material_type, content):
+    """
+    Items for a material if they can be had without calling the model: question items
+    are parsed on demand, flashcard items only returned once built (their options need a
+    distractor call, which belongs to a request that went through admission).
+
+    Returns:
+        list or None: None for flashcards whose items were not built yet.
+    """
+    if material_type in QUESTION_MATERIALS:
+        return get_items(topic, material_type, content)
+    etag = material_etag(content)
+    with _cache_lock:
+        cached = _cache.get((topic.lower(), material_type, etag))
+    return cached if cached is not None else _load_stored(topic, material_type, etag)
+
+
+def store_items(topic, material_type, content):
+    """Parse a material's content and store its items for later page requests."""
+    items = parse_items(material_type, content)
+    path = storage_utils._items_path(topic)
+    etag = material_etag(content)
+    with shared.lock(f"items:{topic.lower()}"):
+        data = storage_utils._read_json(path) or {}
+        # Item keys of recent versions, so a client holding an older version can get a delta
+        history = (data.get(material_type) or {}).get("keys", {})
+        history.pop(etag, None)
+        history[etag] = [item["key"] for item in items]
+        while len(history) > storage_utils.MAX_VERSIONS:
+            del history[next(iter(history))]
+        data[material_type] = {"etag": etag, "items": items, "keys": history}
+        storage_utils._write_json(path, data)
+    return items
+
+
+def item_keys(topic, material_type, etag):
+    """Item keys of a recent version of a material, or None if that version's items are unknown."""
+    stored = (storage_utils._read_json(storage_utils._items_path(topic)) or {}).get(material_type) or {}
+    return stored.get("keys", {}).get(etag)
+
+
+def encode_cursor(etag, offset):
+    raw = json.dumps({"e": etag, "o": offset}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: (etag, offset)
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        etag, offset = data["e"], int(data["o"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+    return etag, offset
+
+
+def page(topic, material_type, content, cursor=None, limit=DEFAULT_PAGE_SIZE, client=None):
+    """
+    One page of a material's items.
+
+    Raises:
+        ValueError: For a malformed cursor or limit.
+        CursorExpired: If the material changed since the cursor was issued.
+    """
+    etag = material_etag(content)
+    offset = 0
+    if cursor:
+        cursor_etag, offset = decode_cursor(cursor)
+        if cursor_etag != etag:
+            raise CursorExpired("The material changed since this cursor was issued; start again without a cursor")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    items = get_items(topic, material_type, content, client)
+    end = offset + limit
+    return {
+        "topic": topic,
+        "material": material_type,
+        "items": items[offset:end],
+        "total": len(items),
+        "next_cursor": encode_cursor(etag, end) if end < len(items) else None,
+    }
+
+
+def get_item(topic, material_type, content, item_id, client=None):
+    """Return one item by id, or None."""
+    items = get_items(topic, material_type, content, client)
+    if 1 <= item_id <= len(items) and items[item_id - 1]["id"] == item_id:
+        return items[item_id - 1]
+    return next((item for item in items if item["id"] == item_id), None)
+
+
+def paging_args(args):
+    """
+    Read ?cursor=&limit=&item= from a request's query args.
+
+    Returns:
+        dict or None: None when the request asked for the whole material.
+
+    Raises:
+        ValueError: If limit or item is not an integer, or the cursor is malformed.
+    """
+    if not any(args.get(name) for name in PAGING_PARAMS):
+        return None
+    cursor = args.get("cursor") or None
+    if cursor:
+        decode_cursor(cursor)
+    try:
+        limit = int(args.get("limit") or DEFAULT_PAGE_SIZE)
+        item_id = int(args["item"]) if args.get("item") else None
+    except ValueError:
+        raise ValueError("limit and item must be integers")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return {"cursor": cursor, "limit": limit, "item": item_id}
+
+
+def render(topic, material_type, content, paging, client=None):
+    """
+    Build the item-level response for a request's paging args; client is charged if
+    flashcard items have to be built (see get_items).
+
+    Returns:
+        tuple: (status, JSON-serializable body)
+    """
+    if paging["item"] is not None:
+        item = get_item(topic, material_type, content, paging["item"], client)
+        if item is None:
+            return 404, {"error": f"No item {paging['item']} in {material_type} for {topic}"}
+        return 200, item
+    try:
+        return 200, page(topic, material_type, content, paging["cursor"], paging["limit"], client)
+    except CursorExpired as e:
+        return 410, {"error": str(e)}
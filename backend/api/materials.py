@@ -0,0 +1,222 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+
+import api.storage_utils as storage_utils
+from api.admission import admission, AdmissionRejected
+from api.shared_state import shared
+import progress
+import tracing
+from tracing import traced
+from study_core import (
+    generate_study_content,
+    generate_flashcards,
+    run_quiz,
+    run_test,
+    track_generation
+)
+
+# Cached materials older than this many seconds are refreshed in the background (0 disables)
+STALE_AFTER = float(os.getenv("MATERIAL_STALE_AFTER", "0"))
+REFRESH_WORKERS = int(os.getenv("MATERIAL_REFRESH_WORKERS", "4"))
+# How long to wait for another process generating the same material before giving up
+GENERATION_LOCK_TIMEOUT = float(os.getenv("GENERATION_LOCK_TIMEOUT", "300"))
+
+_refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_inflight = {}  # (topic, material) -> Future of the generation in progress
+_inflight_lock = threading.Lock()
+
+# Material type -> study_core generator
+GENERATORS = {
+    "study_content": generate_study_content,
+    "flashcards": generate_flashcards,
+    "quiz": run_quiz,
+    "test": run_test,
+}
+
+
+class MockText:
+    def __init__(self):
+        self.output = []
+
+    def insert(self, index, text):
+        self.output.append(text)
+
+    def delete(self, q, a):
+        self.output = []
+
+    def getvalue(self):
+        return "".join(self.output)
+
+
+def load_cached(topic, material_type):
+    """Return the current stored content for a material, or None."""
+    cached = storage_utils.load_material(topic)
+    if cached and material_type in cached:
+        return cached[material_type]
+    return None
+
+
+@traced("materials.generate")
+def generate_material(topic, material_type, study_data):
+    """Run a material's generator against a MockText box and store the result as a new version."""
+    fake_box = MockText()
+    progress.emit("started", topic=topic, material=material_type)
+    with track_generation() as stats:
+        GENERATORS[material_type](topic, fake_box, study_data)
+    content = fake_box.getvalue()
+    progress.emit("generated", topic=topic, material=material_type, content=content)
+    version = storage_utils.save_material(topic, material_type, content, metadata=stats)
+    progress.emit("persisted", topic=topic, material=material_type, version_id=version["id"])
+    from api import items  # items imports material_etag from here
+    if material_type in items.QUESTION_MATERIALS:
+        items.store_items(topic, material_type, content)
+    return content
+
+
+def generate_once(topic, material_type, study_data):
+    """
+    Generate a material, joining an identical generation already running in this process
+    instead of starting a second upstream call. Only the owning call takes a generation slot.
+    Across processes, the owner holds a shared lock; an owner that had to wait for it reuses
+    the content the other process just stored.
+
+    Returns:
+        tuple: (content, shared) where shared is True if another caller's result was reused.
+    """
+    key = (topic.lower(), material_type)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+    if not owner:
+        return future.result(), True
+
+    try:
+        content, shared_result = _generate_exclusive(topic, material_type, study_data)
+        future.set_result(content)
+        return content, shared_result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _generate_exclusive(topic, material_type, study_data):
+    lock_name = f"generate:{topic.lower()}:{material_type}"
+    release = shared.try_lock(lock_name)
+    if release is not None:
+        try:
+            return _generate_with_slot(topic, material_type, study_data), False
+        finally:
+            release()
+
+    # Another process is generating this material: wait, then use what it stored
+    waited_since = time.time()
+    with shared.lock(lock_name, timeout=GENERATION_LOCK_TIMEOUT):
+        age = storage_utils.material_age(topic, material_type)
+        if age is not None and age <= time.time() - waited_since:
+            cached = load_cached(topic, material_type)
+            if cached is not None:
+                return cached, True
+        return _generate_with_slot(topic, material_type, study_data), False
+
+
+def _generate_with_slot(topic, material_type, study_data):
+    admission.acquire()
+    try:
+        return generate_material(topic, material_type, study_data)
+    finally:
+        admission.release()
+
+
+def material_etag(content):
+    """ETag for a material, derived from its stored text."""
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+def is_stale(topic, material_type, refresh=False):
+    """
+    Decide whether cached content should be revalidated. Pinned materials are always
+    fresh: a regenerated version would never be served while the pin holds.
+
+    Returns:
+        tuple: (stale, age_seconds) where age is None if unknown.
+    """
+    if not refresh and STALE_AFTER <= 0:
+        return False, None
+    info = storage_utils.material_info(topic, material_type)
+    if info is None:
+        age = storage_utils.material_age(topic, material_type)
+    else:
+        age = time.time() - info["created_at"]
+        if info["pinned"]:
+            return False, age
+    stale = refresh or (STALE_AFTER > 0 and (age is None or age > STALE_AFTER))
+    return stale, age
+
+
+def refresh_in_background(topic, material_type, study_data, on_done=None, client=None):
+    """
+    Regenerate a material on the refresh pool while callers keep serving the cached copy.
+    At most one refresh per (topic, material) runs at a time, and each takes a global
+    generation slot so refreshes cannot starve foreground requests past the admission limit.
+    If client is given, it is charged only when this call starts a refresh, not when one
+    is already running. on_done, if given, is called once a scheduled refresh has finished
+    (or been skipped), e.g. to commit the session whose study data the refresh wrote to.
+
+    Returns:
+        bool: True if a refresh was scheduled, False if one is already running or the
+        client is over its rate budget.
+    """
+    key = (topic.lower(), material_type)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+    if client is not None:
+        try:
+            admission.check_rate(client)
+        except AdmissionRejected:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+            return False
+
+    def run():
+        try:
+            admission.acquire()
+        except AdmissionRejected as e:
+            print(f"⚠️ Skipped background refresh of {topic}/{material_type}: {e.reason}")
+            return
+        try:
+            generate_material(topic, material_type, study_data)
+            print(f"🔄 Refreshed {topic}/{material_type} in the background")
+        except Exception as e:
+            print(f"❌ Background refresh of {topic}/{material_type} failed: {e}")
+        finally:
+            admission.release()
+
+    def run_and_clear():
+        try:
+            # Traced on its own: the request that scheduled it has already been answered
+            with tracing.start_trace(f"refresh {topic}/{material_type}"):
+                run()
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+            if on_done is not None:
+                try:
+                    on_done()
+                except Exception as e:
+                    print(f"❌ Post-refresh callback for {topic}/{material_type} failed: {e}")
+
+    _refresh_executor.submit(copy_context().run, run_and_clear)
+    return True
@@ -0,0 +1,86 @@
+"""
+Streaming reader for multipart/form-data uploads.
+
+request.form / request.files parse the whole body first, spooling the uploaded file to
+a temporary file before the view can look at it. MultipartFile instead reads the request
+stream as the file part is consumed, so an upload is hashed and stored in one pass, and
+collects the small text fields (such as "topic") on the way, wherever they appear.
+"""
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+CHUNK_SIZE = 64 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class MultipartError(ValueError):
+    """Raised for a malformed body, a missing file part or an oversized text field."""
+
+
+class MultipartFile:
+    """
+    File-like reader over one file field of a multipart body.
+
+    read() returns the file's bytes as they arrive; once it returns b"" the rest of the
+    body has been read too and every text field is in .fields.
+    """
+
+    def __init__(self, stream, boundary, file_field="file"):
+        self.fields = {}
+        self.filename = None
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary.encode())
+        self._file_field = file_field
+        self._buffer = b""
+        self._chunks = self._file_chunks()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _events(self):
+        while True:
+            event = self._decoder.next_event()
+            if isinstance(event, NeedData):
+                if self._decoder.complete:
+                    raise MultipartError("Multipart body ended early")
+                chunk = self._stream.read(CHUNK_SIZE)
+                self._decoder.receive_data(chunk or None)
+            elif isinstance(event, Epilogue):
+                return
+            else:
+                yield event
+
+    def _file_chunks(self):
+        found = False
+        name, is_file, value = None, False, b""
+        try:
+            for event in self._events():
+                if isinstance(event, (Field, File)):
+                    name, is_file, value = event.name, isinstance(event, File), b""
+                    if is_file and name == self._file_field and not found:
+                        found, self.filename = True, event.filename
+                    elif is_file:
+                        name = None  # Other file parts are skipped
+                elif isinstance(event, Data) and name is not None:
+                    if is_file:
+                        if event.data:
+                            yield event.data
+                    else:
+                        value += event.data
+                        if len(value) > MAX_FIELD_BYTES:
+                            raise MultipartError(f"Form field {name!r} is too large")
+                        if not event.more_data:
+                            self.fields[name] = value.decode("utf-8", errors="replace")
+        except ValueError as e:
+            if isinstance(e, MultipartError):
+                raise
+            raise MultipartError(f"Malformed multipart body: {e}")
+        if not found:
+            raise MultipartError(f"Missing {self._file_field!r} file field")
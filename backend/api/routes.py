@@ -1,31 +1,150 @@
 from api import app
-from flask import request, jsonify, send_from_directory
-from study_data import StudyData
-import os, json
+from flask import request, jsonify, send_from_directory, send_file, make_response, Response, stream_with_context, g
+from api.sessions import SessionRegistry
+import os
+import profiling
+import progress
+import tracing
 import api.storage_utils as storage_utils
-from flashcard_web_extraction import extract_cards_for_web_ui, save_all_web_card_data
-
-from study_core import (
-    generate_study_content,
-    generate_flashcards,
-    run_quiz,
-    run_test,
-    generate_answers,
-    generate_batch_mock_answers
+from api import batch, context_store, items, multipart, storage, export, sync
+from api.materials import (
+    generate_once,
+    load_cached,
+    material_etag,
+    is_stale,
+    refresh_in_background
 )
-
-study_data = StudyData(config={"storage_location": "file"})
+from api.admission import admission, client_key, AdmissionRejected
+from api.static_assets import StaticAssetIndex
+
+
+# Request bodies are small JSON documents; routes that take uploads raise their own limit
+app.config.setdefault("MAX_CONTENT_LENGTH", int(float(os.getenv("API_MAX_BODY_MB", "1")) * 1024 * 1024))
+# Room for multipart headers and small fields around an uploaded context
+UPLOAD_OVERHEAD_BYTES = 1024 * 1024
+
+# Debug and progress streams are long-lived or diagnostic, so they are not traced or profiled
+UNTRACED_PREFIXES = ("/api/debug/", "/api/progress/")
+
+sessions = SessionRegistry(config={
+    "storage_location": os.getenv("STUDY_STORAGE_LOCATION", "file"),
+    "write_behind": True,
+})
+
+def request_session_id():
+    """Select the caller's session data by X-Session-Id, ?session_id= or remote address."""
+    return (
+        request.headers.get("X-Session-Id")
+        or request.args.get("session_id")
+        or client_id()
+    )
+
+def client_id():
+    """
+    Identity that rate limits are charged to: the remote address, which the client cannot
+    rotate the way it can a session id (set TRUSTED_PROXY_HOPS behind a reverse proxy).
+    """
+    return client_key(request.remote_addr)
+
+def get_study_data(session_id=None):
+    """Return the StudyData for the calling client's session; it is committed when the request ends."""
+    session_id = session_id or request_session_id()
+    g.setdefault("session_ids", set()).add(session_id)
+    return sessions.get(session_id)
+
+@app.teardown_request
+def commit_sessions(exc=None):
+    for session_id in g.pop("session_ids", ()):
+        sessions.commit(session_id)
+
+@app.errorhandler(storage_utils.InvalidTopic)
+def invalid_topic(e):
+    return jsonify({"error": str(e)}), 400
+
+@app.errorhandler(AdmissionRejected)
+def admission_rejected(e):
+    response = jsonify({"error": e.reason, "retry_after": e.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+@app.before_request
+def start_request_trace():
+    """Trace API requests under the caller's X-Request-Id, or a new one."""
+    if not request.path.startswith("/api/") or request.path.startswith(UNTRACED_PREFIXES):
+        return
+    g.trace, g.trace_token = tracing.begin_trace(
+        f"{request.method} {request.path}", request.headers.get("X-Request-Id")
+    )
+
+@app.after_request
+def tag_request_id(response):
+    trace = g.get("trace")
+    if trace is not None:
+        response.headers["X-Request-Id"] = trace.request_id
+        g.trace_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_trace(exc=None):
+    trace = g.pop("trace", None)
+    if trace is not None:
+        tracing.end_trace(trace, g.pop("trace_token"), status=g.get("trace_status", 500),
+                          topic=request.args.get("topic"))
+
+@app.before_request
+def start_request_profile():
+    """Profile API requests that ask for it (X-Profile / ?profile=) or are sampled."""
+    if not request.path.startswith("/api/") or request.path.startswith(UNTRACED_PREFIXES):
+        return
+    if profiling.should_profile(request.headers.get("X-Profile") or request.args.get("profile")):
+        g.profile = profiling.begin_profile(f"{request.method} {request.path}", tracing.current_request_id())
+
+@app.after_request
+def tag_profile_id(response):
+    profile = g.get("profile")
+    if profile is not None:
+        response.headers["X-Profile-Id"] = profile.id
+    return response
+
+@app.teardown_request
+def finish_request_profile(exc=None):
+    profile = g.pop("profile", None)
+    if profile is not None:
+        profiling.end_profile(profile, topic=request.args.get("topic"), request_id=tracing.current_request_id())
+
+@app.before_request
+def attach_progress_channel():
+    """Publish progress for requests that carry X-Progress-Id (or ?progress_id=)."""
+    progress_id = request.headers.get("X-Progress-Id") or request.args.get("progress_id")
+    if progress_id and request.path.startswith("/api/") and not request.path.startswith("/api/progress/"):
+        g.progress_token = progress.attach(progress_id)
+
+@app.teardown_request
+def close_progress_channel(exc=None):
+    token = g.pop("progress_token", None)
+    if token is not None:
+        progress.detach(token, error=exc)
+
+static_index = StaticAssetIndex(app.static_folder)
+
+def build_static_index():
+    """Index the frontend before serving; missing compressed copies are written in the background."""
+    assets = static_index.build_in_background()
+    print(f"✅ Indexed {len(assets)} static assets")
 
 @app.route("/")
 def serve_index():
-    return send_from_directory(app.static_folder, "index.html")
+    return static_index.serve("index.html") or send_from_directory(app.static_folder, "index.html")
 
 @app.route("/<path:path>")
 def serve_static(path):
-    full_path = os.path.join(app.static_folder, path)
-    if os.path.isfile(full_path):
-        return send_from_directory(app.static_folder, path)
-    return send_from_directory(app.static_folder, "index.html")
+    # Unknown paths fall back to index.html so client-side routes work
+    return (
+        static_index.serve(path)
+        or static_index.serve("index.html")
+        or send_from_directory(app.static_folder, "index.html")
+    )
 
 @app.route("/api/health")
 def health():
@@ -37,44 +156,84 @@ def add_topic():
     topic = data.get("topic")
     if not topic:
         return jsonify({"error": "Topic is required"}), 400
-    study_data["topics"] = study_data.get("topics", []) + [topic]
+    storage.add_topic_to_file(topic)
     return jsonify({"message": "Topic added", "topic": topic})
 
 @app.route("/api/get_topics", methods=["GET"])
 def get_topics():
-    return jsonify({"topics": study_data.get("topics", [])})
+    return jsonify({"topics": storage.get_all_topics_from_file()})
 
-class MockText:
-    def __init__(self):
-        self.output = []
+def _generate_material(topic, material_type, force=False):
+    """Generate a material for the calling client's session, subject to admission control."""
+    admission.check_rate(client_id(), force)
+    content, _ = generate_once(topic, material_type, get_study_data())
+    return content
 
-    def insert(self, index, text):
-        self.output.append(text)
+def _material_response(content, render=None):
+    """
+    Respond with a material, tagged with an ETag derived from its stored text.
+    Matching If-None-Match headers get a 304 before any rendering work is done.
+    """
+    etag = material_etag(content)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = make_response(render() if render else content)
+    response.set_etag(etag)
+    return response
+
+def _serve_material(topic, material_type, render=None):
+    """
+    Serve a material from storage, generating it only when nothing is cached or ?force=true.
+    Stale copies (older than MATERIAL_STALE_AFTER, or ?refresh=true) are still served
+    immediately while a background refresh prepares new content for the next view.
+    """
+    force = request.args.get("force", "false").lower() == "true"
+    cached = None if force else load_cached(topic, material_type)
+    if cached is None:
+        content = _generate_material(topic, material_type, force=force)
+        response = _material_response(content, render and (lambda: render(content)))
+        response.headers["X-Cache"] = "MISS"
+        return response
+
+    refresh = request.args.get("refresh", "false").lower() == "true"
+    stale, age = is_stale(topic, material_type, refresh)
+    if stale:
+        # Charged only if this starts a refresh; over budget, the cached copy is served as is.
+        # The request's teardown commits before the refresh is done, so commit again after it
+        session_id = request_session_id()
+        refresh_in_background(topic, material_type, sessions.get(session_id),
+                              on_done=lambda: sessions.commit(session_id), client=client_id())
+    response = _material_response(cached, render and (lambda: render(cached)))
+    response.headers["X-Cache"] = "STALE" if stale else "HIT"
+    if age is not None:
+        response.headers["Age"] = str(int(age))
+    return response
+
+def _serve_items(topic, material_type, render=None):
+    """
+    Serve a material whole, or item by item when the request has ?cursor=, ?limit= or ?item=.
+    Pages come from the material's stored items, so clients fetch only what they render.
+    """
+    try:
+        paging = items.paging_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if paging is None:
+        return _serve_material(topic, material_type, render)
 
-    def delete(self, q, a):
-        self.output = []
+    def render_items(content):
+        status, body = items.render(topic, material_type, content, paging, client_id())
+        return jsonify(body), status
+    return _serve_material(topic, material_type, render_items)
 
-    def getvalue(self):
-        return "".join(self.output)
-    
 @app.route("/api/study_content", methods=["POST"])
 def api_study_content():
     topic = request.json.get("topic", "").strip()
     if not topic:
         return jsonify({"error": "Missing topic"}), 400
 
-    force = request.args.get("force", "false").lower() == "true"
-    if not force:
-        cached = storage_utils.load_material(topic)
-        if cached and "study_content" in cached:
-            return cached["study_content"]
-
-    fake_box = MockText()
-    generate_study_content(topic, fake_box, study_data)
-    content = fake_box.getvalue()
-    storage_utils.save_material(topic, "study_content", content)
-
-    return content
+    return _serve_material(topic, "study_content")
 
 @app.route("/api/flashcards", methods=["GET", "POST"])
 def api_flashcards():
@@ -82,23 +241,10 @@ def api_flashcards():
     if request.method == "POST":
         topic = request.json.get("topic", "").strip()
 
-    force = request.args.get("force", "false").lower() == "true"
     if not topic:
         return jsonify({"error": "Missing topic"}), 400
 
-    if not force:
-        cached = storage_utils.load_material(topic)
-        if cached and "flashcards" in cached:
-            content = cached["flashcards"]
-            return jsonify(extract_cards_for_web_ui(content))
-
-    fake_box = MockText()
-    generate_flashcards(topic, fake_box, study_data)
-    content = fake_box.getvalue()
-    storage_utils.save_material(topic, "flashcards", content)
-
-    cards = extract_cards_for_web_ui(content)
-    return jsonify(cards)
+    return _serve_items(topic, "flashcards", lambda content: jsonify(items.get_items(topic, "flashcards", content, client_id())))
 
 @app.route("/api/quiz", methods=["GET", "POST"])
 def api_quiz():
@@ -106,20 +252,10 @@ def api_quiz():
     if request.method == "POST":
         topic = request.json.get("topic", "").strip()
 
-    force = request.args.get("force", "false").lower() == "true"
     if not topic:
         return jsonify({"error": "Missing topic"}), 400
 
-    if not force:
-        cached = storage_utils.load_material(topic)
-        if cached and "quiz" in cached:
-            return cached["quiz"]
-
-    fake_box = MockText()
-    run_quiz(topic, fake_box, study_data)
-    content = fake_box.getvalue()
-    storage_utils.save_material(topic, "quiz", content)
-    return content
+    return _serve_items(topic, "quiz")
 
 @app.route("/api/test", methods=["GET", "POST"])
 def api_test():
@@ -127,20 +263,10 @@ def api_test():
     if request.method == "POST":
         topic = request.json.get("topic", "").strip()
 
-    force = request.args.get("force", "false").lower() == "true"
     if not topic:
         return jsonify({"error": "Missing topic"}), 400
 
-    if not force:
-        cached = storage_utils.load_material(topic)
-        if cached and "test" in cached:
-            return cached["test"]
-
-    fake_box = MockText()
-    run_test(topic, fake_box, study_data)
-    content = fake_box.getvalue()
-    storage_utils.save_material(topic, "test", content)
-    return content
+    return _serve_items(topic, "test")
 
 @app.route("/api/generate_all", methods=["POST"])
 def generate_all():
@@ -148,33 +274,248 @@ def generate_all():
     if not topic:
         return jsonify({"error": "Missing topic"}), 400
 
-    fake_box = MockText()
-    generate_study_content(topic, fake_box, study_data)
-    generate_flashcards(topic, fake_box, study_data)
-    run_quiz(topic, fake_box, study_data)
-    run_test(topic, fake_box, study_data)
+    study_data = get_study_data()
+    steps = ["study_content", "flashcards", "quiz", "test"]
+    # One forced request on the client's budget; each generation takes its own admission slot
+    admission.check_rate(client_id(), force=True)
+    for index, material_type in enumerate(steps, start=1):
+        generate_once(topic, material_type, study_data)
+        progress.emit("step", topic=topic, material=material_type, index=index, total=len(steps))
 
     return jsonify({"message": "All content generated for topic", "topic": topic})
 
+@app.route("/api/batch", methods=["POST"])
+def generate_batch():
+    """
+    Prepare many materials in one request: {"items": [{"topic": ..., "material": ...}, ...]}.
+    Results stream back as NDJSON lines as each one completes.
+    """
+    data = request.json or {}
+    try:
+        pairs = batch.parse_items(data.get("items"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # A batch that needs generating is charged to the client's budget once, as one request
+    force = request.args.get("force", "false").lower() == "true"
+
+    return Response(
+        stream_with_context(batch.stream_ndjson(pairs, get_study_data(), client_id(), force)),
+        mimetype="application/x-ndjson",
+    )
+
+@app.route("/api/progress/<progress_id>", methods=["GET"])
+def progress_events(progress_id):
+    """Server-sent events for the request sent with X-Progress-Id: <progress_id>."""
+    last_event_id = request.headers.get("Last-Event-ID", 0, type=int)
+    events = progress.bus.stream(progress_id, last_event_id)
+    return Response(
+        stream_with_context(progress.format_sse(event) for event in events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _pack_response(payload):
+    """JSON response, gzipped when the client accepts it (packs compress several-fold)."""
+    if request.accept_encodings["gzip"]:
+        response = make_response(sync.compress(payload))
+        response.headers["Content-Encoding"] = "gzip"
+        response.mimetype = "application/json"
+    else:
+        response = jsonify(payload)
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+@app.route("/api/study_pack", methods=["GET"])
+def study_pack():
+    """Every stored material of a topic, with its version vector, as one compressed bundle."""
+    topic = request.args.get("topic", "").strip()
+    if not topic:
+        return jsonify({"error": "Missing topic"}), 400
+
+    versions = sync.version_vector(topic)
+    if not versions:
+        return jsonify({"error": "No saved content for topic"}), 404
+    etag = sync.pack_etag(versions)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = _pack_response(sync.build_pack(topic))
+    response.set_etag(etag)
+    return response
+
+@app.route("/api/sync", methods=["POST"])
+def sync_study_pack():
+    """
+    Bring a study pack up to date: {"topic": ..., "versions": {material: etag}}.
+    Only materials (or quiz/test/flashcard items) changed since those versions are returned.
+    """
+    data = request.json or {}
+    topic = (data.get("topic") or "").strip()
+    versions = data.get("versions") or {}
+    if not topic or not isinstance(versions, dict):
+        return jsonify({"error": "Missing topic or versions"}), 400
+    return _pack_response(sync.sync(topic, versions))
+
 @app.route("/api/get_flashcard_layout")
 def get_flashcard_layout():
+    """
+    Card layout (question, answer, options) for a topic's stored flashcards.
+    Built once per flashcard version and kept per topic by api.items, so repeat requests
+    are served from memory and concurrent ones never see another topic's cards.
+    """
     topic = request.args.get("topic", "").strip()
-    path = os.path.join("stored_materials", f"{topic}.json")
-    if not os.path.exists(path):
+    stored = storage_utils.load_material(topic) if topic else None
+    if stored is None:
         return jsonify({"error": "No saved content for topic"}), 404
 
+    content = stored.get("flashcards") or ""
+    return _material_response(content, lambda: jsonify({"layout": items.get_items(topic, "flashcards", content, client_id())}))
+
+@app.route("/api/material_versions", methods=["GET"])
+def material_versions():
+    topic = request.args.get("topic", "").strip()
+    material = request.args.get("material", "").strip()
+    if not topic or not material:
+        return jsonify({"error": "Missing topic or material"}), 400
+    return jsonify(storage_utils.list_versions(topic, material))
+
+@app.route("/api/pin_version", methods=["POST"])
+def pin_version():
+    return _select_version(storage_utils.pin_version)
+
+@app.route("/api/rollback_version", methods=["POST"])
+def rollback_version():
+    return _select_version(storage_utils.rollback_version)
+
+@app.route("/api/unpin_version", methods=["POST"])
+def unpin_version():
+    data = request.json or {}
+    topic = data.get("topic", "").strip()
+    material = data.get("material", "").strip()
+    if not topic or not material:
+        return jsonify({"error": "Missing topic or material"}), 400
+    storage_utils.unpin_version(topic, material)
+    return jsonify({"message": "Version unpinned", "topic": topic, "material": material})
+
+def _select_version(select):
+    data = request.json or {}
+    topic = data.get("topic", "").strip()
+    material = data.get("material", "").strip()
+    version_id = data.get("version_id", "").strip()
+    if not topic or not material or not version_id:
+        return jsonify({"error": "Missing topic, material or version_id"}), 400
     try:
-        with open(path, "r") as f:
-            data = json.load(f)
-            raw_text = data.get("flashcards", "")
-    except:
-        return jsonify({"error": "Could not read flashcards"}), 500
+        version = select(topic, material, version_id)
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"message": "Version selected", "version": version})
+
+@app.route("/api/context", methods=["POST"])
+def upload_context():
+    """
+    Accept a multipart "file" field or a raw request body and attach it to a topic.
+    The body is streamed to disk as it arrives (never spooled by request.form); the topic
+    comes from ?topic= or, for multipart uploads, a "topic" field anywhere in the form.
+    """
+    request.max_content_length = context_store.MAX_CONTEXT_BYTES + UPLOAD_OVERHEAD_BYTES
+    topic = request.args.get("topic", "").strip()
+    boundary = request.mimetype_params.get("boundary")
+    if request.mimetype == "multipart/form-data" and boundary:
+        stream = multipart.MultipartFile(request.stream, boundary)
+    elif not topic:
+        return jsonify({"error": "Missing topic"}), 400
+    else:
+        stream = request.stream
+    try:
+        stored = context_store.save_context_stream(stream)
+    except context_store.ContextTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except multipart.MultipartError as e:
+        return jsonify({"error": str(e)}), 400
 
-    global cards
-    cards = extract_cards_for_web_ui(raw_text)
-    save_all_web_card_data()
+    topic = topic or getattr(stream, "fields", {}).get("topic", "").strip()
+    if not topic:
+        # Stored by hash, so a retry with the topic is deduplicated
+        return jsonify({"error": "Missing topic"}), 400
+    if stored["size"] == 0:
+        return jsonify({"error": "Empty context upload"}), 400
 
-    with open("ui_layout.json", "r") as layout_file:
-        layout = json.load(layout_file)
+    context_store.attach_context(topic, stored["hash"])
+    return jsonify({"message": "Context attached", "topic": topic, **stored})
 
-    return jsonify({"layout": layout})
+@app.route("/api/context", methods=["GET"])
+def get_context():
+    topic = request.args.get("topic", "").strip()
+    if not topic:
+        return jsonify({"error": "Missing topic"}), 400
+    context_hash = context_store.get_topic_context_hash(topic)
+    if not context_hash:
+        return jsonify({"error": "No context attached to topic"}), 404
+    return jsonify({"topic": topic, "hash": context_hash})
+
+def debug_forbidden():
+    """403 response unless the request may read debug data (see profiling.debug_access_allowed)."""
+    token = request.headers.get("X-Debug-Token") or request.args.get("token")
+    if profiling.debug_access_allowed(token):
+        return None
+    return jsonify({"error": "Debug endpoints are disabled or need a valid token"}), 403
+
+@app.route("/api/debug/traces", methods=["GET"])
+def debug_traces():
+    """
+    Recent request traces as Chrome trace-event JSON (open in chrome://tracing or Perfetto).
+    ?limit=, ?min_ms= and ?request_id= narrow the selection; ?format=summary lists them instead.
+    Traces include topics and timings, so this needs the profiling config (X-Debug-Token).
+    """
+    forbidden = debug_forbidden()
+    if forbidden:
+        return forbidden
+    traces = tracing.recent_traces(
+        limit=request.args.get("limit", 20, type=int),
+        min_ms=request.args.get("min_ms", 0, type=float),
+        request_id=request.args.get("request_id"),
+    )
+    if request.args.get("format") == "summary":
+        return jsonify([trace.to_dict() for trace in traces])
+    return jsonify(tracing.to_chrome_trace(traces))
+
+@app.route("/api/debug/profiles", methods=["GET"])
+def debug_profiles():
+    """List stored request profiles, newest first."""
+    forbidden = debug_forbidden()
+    if forbidden:
+        return forbidden
+    return jsonify({"enabled": profiling.PROFILING_ENABLED, "sample_rate": profiling.PROFILE_SAMPLE_RATE,
+                    "profiles": profiling.list_profiles()})
+
+@app.route("/api/debug/profiles/<profile_id>", methods=["GET"])
+def debug_profile(profile_id):
+    """Download a profile: ?format=txt (report, default) or ?format=prof (cProfile stats)."""
+    forbidden = debug_forbidden()
+    if forbidden:
+        return forbidden
+    extension = request.args.get("format", "txt")
+    if extension not in ("txt", "prof") or profile_id not in {p["id"] for p in profiling.list_profiles()}:
+        return jsonify({"error": "Profile not found"}), 404
+    path = os.path.join(profiling.PROFILE_DIR, f"{profile_id}.{extension}")
+    return send_file(path, mimetype="text/plain" if extension == "txt" else "application/octet-stream",
+                     as_attachment=extension == "prof")
+
+@app.route("/api/export", methods=["GET"])
+def export_materials():
+    """Stream stored materials as markdown, csv or an Anki import file (?format=, repeatable ?topic=)."""
+    fmt = request.args.get("format", "markdown").lower()
+    if fmt not in export.EXPORTERS:
+        return jsonify({"error": f"Unsupported format: {fmt}"}), 400
+    exporter, mimetype, extension = export.EXPORTERS[fmt]
+    try:
+        topics = export.resolve_topics(request.args.getlist("topic"))
+    except KeyError as e:
+        return jsonify({"error": f"Unknown topic: {e.args[0]}"}), 400
+
+    return Response(
+        stream_with_context(exporter(topics)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=study_materials.{extension}"},
+    )
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from api.shared_state import shared, SHARED_STATE_ENABLED
+from study_data import StudyData
+
+SESSION_DIR = os.path.join(os.getcwd(), "data", "sessions")
+MAX_SESSIONS = int(os.getenv("STUDY_MAX_SESSIONS", "200"))
+MAX_SESSION_MEMORY = int(float(os.getenv("STUDY_MAX_SESSION_MEMORY_MB", "64")) * 1024 * 1024)
+SESSION_IDLE_TIMEOUT = float(os.getenv("STUDY_SESSION_IDLE_TIMEOUT", "1800"))
+
+
+class SessionRegistry:
+    """
+    Keeps one StudyData per client session in memory, evicting idle or least recently
+    used sessions and reloading them from storage when they come back.
+
+    With shared state enabled, each session has a version counter shared by all processes:
+    commit() flushes a session and bumps it, and get() reloads a session whose counter moved
+    because another process wrote to it.
+
+    Evicted sessions are flushed, not closed: a request or background refresh may still be
+    using the StudyData, and it is released once the last of them is done with it.
+    """
+
+    def __init__(self, config=None, max_sessions=MAX_SESSIONS, max_memory=MAX_SESSION_MEMORY,
+                 idle_timeout=SESSION_IDLE_TIMEOUT):
+        """
+        Args:
+            config (dict): Base StudyData config applied to every session.
+            max_sessions (int): Maximum number of sessions held in memory.
+            max_memory (int): Approximate byte cap across all in-memory sessions.
+            idle_timeout (float): Seconds after which an unused session is evicted.
+        """
+        self.config = config or {"storage_location": "file", "write_behind": True}
+        self.max_sessions = max_sessions
+        self.max_memory = max_memory
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()  # session_id -> (StudyData, last_access)
+        self._sizes = {}
+        self._versions = {}  # session_id -> shared version the in-memory copy reflects
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """
+        Returns the StudyData for a session, loading it from storage if needed.
+
+        Args:
+            session_id (str): The client or session identifier.
+
+        Returns:
+            StudyData: The session's study data.
+        """
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            version = _shared_version(session_id)
+            if entry is not None and version != self._versions.get(session_id):
+                # Another process changed this session since we loaded it
+                entry[0].flush()
+                entry = None
+            if entry is None:
+                study_data = self._load(session_id)
+                self._versions[session_id] = version
+            else:
+                study_data = entry[0]
+            self._sessions[session_id] = (study_data, time.monotonic())
+            self._sizes[session_id] = study_data.memory_usage()
+            self._evict(keep=session_id)
+            return study_data
+
+    def commit(self, session_id):
+        """
+        Flush a session's pending writes and let other processes know it changed.
+
+        The version is compare-and-set under a per-session lock: if another process committed
+        since this copy was loaded, our writes are still flushed (they merge key by key), but
+        the copy is dropped so the next get() reloads the combined state.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return
+            if not SHARED_STATE_ENABLED:
+                entry[0].flush()
+                return
+            digest = _digest(session_id)
+            with shared.lock(f"session:{digest}"):
+                current = shared.get("session-version", digest, 0)
+                entry[0].flush()
+                shared.set("session-version", digest, current + 1)
+            if current == self._versions.get(session_id):
+                self._versions[session_id] = current + 1
+            else:
+                self._drop(session_id)
+
+    def _load(self, session_id):
+        config = dict(self.config)
+        location = config.get("storage_location")
+        digest = _digest(session_id)
+        if location == "file":
+            config["location_path"] = os.path.join(SESSION_DIR, f"{digest}.json")
+        elif location == "sqlite":
+            config["card_name"] = f"session:{digest}"
+        study_data = StudyData(config=config)
+        if location == "file":
+            study_data.load_from_file(study_data.location_path)
+        elif location == "sqlite":
+            study_data.load_from_db()
+        return study_data
+
+    def _evict(self, keep):
+        now = time.monotonic()
+        for session_id, (_, last_access) in list(self._sessions.items()):
+            if session_id != keep and now - last_access > self.idle_timeout:
+                self._drop(session_id)
+
+        # Oldest entries come first in the OrderedDict
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or sum(self._sizes.values()) > self.max_memory
+        ):
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                break
+            self._drop(oldest)
+
+    def _drop(self, session_id):
+        study_data, _ = self._sessions.pop(session_id)
+        self._sizes.pop(session_id, None)
+        self._versions.pop(session_id, None)
+        study_data.flush()
+
+    def close(self):
+        """Flushes and closes every in-memory session; used at shutdown."""
+        with self._lock:
+            for session_id in list(self._sessions):
+                study_data, _ = self._sessions[session_id]
+                self._drop(session_id)
+                study_data.close()
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+def _digest(session_id):
+    return hashlib.sha256(session_id.encode()).hexdigest()[:32]
+
+
+def _shared_version(session_id):
+    if not SHARED_STATE_ENABLED:
+        return None
+    return shared.get("session-version", _digest(session_id), 0)
@@ -0,0 +1,179 @@
+"""
+Cross-process shared state for running several server processes on one host, or nodes
+sharing a volume.
+
+Small values (counters, markers, rate-limit buckets, the desktop's global context) live
+in an SQLite key-value table in WAL mode; read-modify-write updates run in IMMEDIATE
+transactions so concurrent processes serialize on them. Named locks are file locks
+(filelock) that work across processes and exclude other threads in this process too.
+
+Everything is keyed by (namespace, key); values are JSON.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from filelock import FileLock, Timeout
+
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR", os.path.join(os.getcwd(), "data", "shared"))
+# Cross-process session versioning and rate limits; locks are always shared
+SHARED_STATE_ENABLED = os.getenv("SHARED_STATE_ENABLED", "1") == "1"
+LOCK_TIMEOUT = float(os.getenv("SHARED_LOCK_TIMEOUT", "60"))
+
+
+class LockTimeout(Exception):
+    """Raised when a shared lock cannot be acquired in time."""
+
+
+class SharedState:
+    def __init__(self, directory=SHARED_STATE_DIR):
+        self.directory = directory
+        self.db_path = os.path.join(directory, "state.db")
+        self.lock_dir = os.path.join(directory, "locks")
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._local = threading.local()
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        # Switching to WAL needs exclusive access, so processes starting together take turns;
+        # the mode is stored in the database file and only has to be set once
+        with FileLock(os.path.join(self.lock_dir, "init.lock")):
+            db = self._connect()
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+
+    def _connect(self):
+        """One connection per thread; SQLite connections must not be shared across threads."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def get(self, namespace, key, default=None):
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        with self._transaction() as db:
+            self._write(db, namespace, key, value, now + ttl if ttl else None, now)
+
+    def delete(self, namespace, key):
+        with self._transaction() as db:
+            db.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def update(self, namespace, key, func, default=None, ttl=None):
+        """
+        Atomically replace a value with func(current) across all processes.
+
+        Returns:
+            The new value.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            current = default if row is None or (row[1] is not None and row[1] < now) else json.loads(row[0])
+            value = func(current)
+            self._write(db, namespace, key, value, now + ttl if ttl else None, now)
+            return value
+
+    def incr(self, namespace, key, amount=1):
+        return self.update(namespace, key, lambda value: (value or 0) + amount)
+
+    def claim(self, namespace, key, owner, ttl):
+        """
+        Set a marker only if no live one exists (e.g. "this process is generating X").
+
+        Returns:
+            bool: True if this caller now holds the marker.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is not None and (row[0] is None or row[0] >= now):
+                return False
+            self._write(db, namespace, key, owner, now + ttl, now)
+            return True
+
+    def purge_expired(self):
+        with self._transaction() as db:
+            return db.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?",
+                              (time.time(),)).rowcount
+
+    @staticmethod
+    def _write(db, namespace, key, value, expires_at, now):
+        db.execute(
+            "INSERT INTO kv (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, "
+            "expires_at = excluded.expires_at, updated_at = excluded.updated_at",
+            (namespace, key, json.dumps(value), expires_at, now),
+        )
+
+    def _file_lock(self, name):
+        digest = hashlib.sha256(name.encode()).hexdigest()[:32]
+        with self._locks_guard:
+            lock = self._locks.get(digest)
+            if lock is None:
+                # Thread-local lock state gives each thread its own descriptor, so the
+                # lock also excludes other threads of this process
+                lock = self._locks[digest] = FileLock(os.path.join(self.lock_dir, f"{digest}.lock"))
+            return lock
+
+    @contextmanager
+    def lock(self, name, timeout=LOCK_TIMEOUT):
+        """
+        Hold a named lock across processes for the duration of the block.
+
+        Raises:
+            LockTimeout: If the lock is not acquired within timeout seconds.
+        """
+        lock = self._file_lock(name)
+        try:
+            lock.acquire(timeout=timeout)
+        except Timeout:
+            raise LockTimeout(f"Timed out waiting for shared lock {name!r}")
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def try_lock(self, name):
+        """Acquire a named lock without waiting; returns the release callable, or None if held elsewhere."""
+        lock = self._file_lock(name)
+        try:
+            lock.acquire(timeout=0)
+        except Timeout:
+            return None
+        return lock.release
+
+
+shared = SharedState()
@@ -0,0 +1,187 @@
+"""
+Precompressed static asset serving for the Flutter web frontend.
+
+The index of assets (size, mimetype, ETag, compressed variants) is built when the server
+starts (see build_static_index in the entry points): the scan is done up front and any
+missing compressed copies are written by a background thread, so startup does not wait
+for compression and assets are served uncompressed until their copies exist. Run
+    python -m api.static_assets
+at image build time to write the copies ahead of time.
+ETags come from the content hashes in flutter_service_worker.js where available.
+Compressed copies are cached on disk by ETag, so each build is compressed only once.
+
+Flutter web builds keep the same URLs across releases (index.html, main.dart.js,
+canvaskit/*, assets/*), so every asset is served with no-cache and revalidated by ETag.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import threading
+
+from flask import current_app, request, send_file
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+CACHE_DIR = os.path.join(os.getcwd(), "static_cache")
+MIN_COMPRESS_BYTES = 1024
+COMPRESSIBLE_EXTENSIONS = {".js", ".mjs", ".wasm", ".html", ".json", ".css", ".txt", ".svg",
+                           ".symbols", ".otf", ".ttf", ".frag", ".bin", ""}
+REVALIDATE_CACHE = "no-cache"
+SERVICE_WORKER_HASHES = re.compile(r'"([^"]+)":\s*"([0-9a-f]{32})"')
+
+mimetypes.add_type("application/wasm", ".wasm")
+mimetypes.add_type("text/javascript", ".mjs")
+
+
+class StaticAssetIndex:
+    """In-memory index of static files and their precompressed variants."""
+
+    def __init__(self, root, cache_dir=CACHE_DIR):
+        self.root = root
+        self.cache_dir = cache_dir
+        self.assets = None
+        self._lock = threading.Lock()
+
+    def build(self, compress=True):
+        """
+        Scan the static root and compute ETags. Missing compressed variants are written
+        when compress is set; otherwise only variants already on disk are used.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        hashes = self._service_worker_hashes()
+        assets = {}
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                rel_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+                etag = hashes.get(rel_path) or _file_hash(path)
+                assets[rel_path] = {
+                    "path": path,
+                    "size": os.path.getsize(path),
+                    "etag": etag,
+                    "mimetype": mimetypes.guess_type(name)[0] or "application/octet-stream",
+                    "variants": self._compress(path, etag, create=compress),
+                }
+        self.assets = assets
+        return assets
+
+    def build_in_background(self):
+        """
+        Index the static root now, using the compressed variants already on disk, and
+        write the missing ones on a background thread that swaps in the full index.
+
+        Returns:
+            dict: The initial index.
+        """
+        assets = self.build(compress=False)
+        missing = sum(1 for asset in assets.values() if _compressible(asset["path"]) and not asset["variants"])
+        if missing:
+            threading.Thread(target=self._compress_all, args=(missing,), name="static-compress", daemon=True).start()
+        return assets
+
+    def _compress_all(self, missing):
+        try:
+            self.build()
+            print(f"✅ Precompressed {missing} static asset(s) into {self.cache_dir}")
+        except Exception as e:
+            print(f"❌ Failed to precompress static assets: {e}")
+
+    def _service_worker_hashes(self):
+        sw_path = os.path.join(self.root, "flutter_service_worker.js")
+        if not os.path.exists(sw_path):
+            return {}
+        with open(sw_path, encoding="utf-8") as f:
+            return dict(SERVICE_WORKER_HASHES.findall(f.read()))
+
+    def _compress(self, path, etag, create=True):
+        """Return {encoding: path} for compressed variants, creating any that are missing if create is set."""
+        if not _compressible(path):
+            return {}
+        variants = {}
+        gz_path = os.path.join(self.cache_dir, f"{etag}.gz")
+        if not os.path.exists(gz_path) and create:
+            with open(path, "rb") as src, gzip.open(f"{gz_path}.tmp", "wb", compresslevel=9) as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(f"{gz_path}.tmp", gz_path)
+        if os.path.exists(gz_path):
+            variants["gzip"] = gz_path
+
+        if brotli is not None:
+            br_path = os.path.join(self.cache_dir, f"{etag}.br")
+            if not os.path.exists(br_path) and create:
+                with open(path, "rb") as src:
+                    data = brotli.compress(src.read(), quality=11)
+                with open(f"{br_path}.tmp", "wb") as dst:
+                    dst.write(data)
+                os.replace(f"{br_path}.tmp", br_path)
+            if os.path.exists(br_path):
+                variants["br"] = br_path
+
+        # Keep only variants that actually save bytes
+        size = os.path.getsize(path)
+        return {enc: p for enc, p in variants.items() if os.path.getsize(p) < size}
+
+    def get(self, rel_path):
+        if self.assets is None:
+            # Normally built at startup; this only covers apps run without an entry point
+            with self._lock:
+                if self.assets is None:
+                    self.build_in_background()
+        return self.assets.get(rel_path)
+
+    def serve(self, rel_path):
+        """
+        Build a response for an asset, choosing the best encoding the client accepts.
+
+        Returns:
+            Response, or None if the asset is not in the index.
+        """
+        asset = self.get(rel_path)
+        if asset is None:
+            return None
+
+        accepted = request.accept_encodings
+        encoding = next((enc for enc in ("br", "gzip") if enc in asset["variants"] and accepted[enc]), None)
+        etag = f"{asset['etag']}-{encoding}" if encoding else asset["etag"]
+
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            path = asset["variants"][encoding] if encoding else asset["path"]
+            response = send_file(path, mimetype=asset["mimetype"], conditional=False, etag=False)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = REVALIDATE_CACHE
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+def _compressible(path):
+    extension = os.path.splitext(path)[1].lower()
+    return extension in COMPRESSIBLE_EXTENSIONS and os.path.getsize(path) >= MIN_COMPRESS_BYTES
+
+
+def _file_hash(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+if __name__ == "__main__":
+    from api import app
+
+    index = StaticAssetIndex(app.static_folder)
+    assets = index.build()
+    compressed = sum(1 for asset in assets.values() if asset["variants"])
+    print(f"✅ Indexed {len(assets)} static assets, {compressed} precompressed into {CACHE_DIR}")
+    print(json.dumps({path: sorted(asset["variants"]) for path, asset in assets.items() if asset["variants"]}, indent=2))
@@ -1,25 +1,57 @@
+import hashlib
 import json
 import os
-import requests
+import threading
+import time
+from api import context_store
+from api.shared_state import shared
 
-uploaded_context = ""
 TOPIC_FILE = os.path.join(os.path.dirname(__file__), "topics.json")
+TOPIC_LOG = os.path.join(os.path.dirname(__file__), "topics.log")
+TOPIC_LOG_COMPACT_BYTES = int(os.getenv("TOPIC_LOG_COMPACT_BYTES", str(1024 * 1024)))
+TOPIC_LOG_COMPACT_INTERVAL = float(os.getenv("TOPIC_LOG_COMPACT_INTERVAL", "3600"))
 
 
 def upload_context_file(file_path):
     """Read and store context from a file (used programmatically)."""
-    global uploaded_context
     try:
         with open(file_path, "r") as file:
-            uploaded_context = file.read()
+            text = file.read()
+            # Kept in shared state so every process sees the same fallback context; the hash
+            # is stored with it so prompt building never re-hashes the text
+            shared.set("context", "uploaded", {"text": text, "hash": _hash_text(text)})
         print("✅ File uploaded successfully and context stored.")
     except Exception as e:
         print(f"❌ Error reading file: {str(e)}")
 
 
-def get_uploaded_context():
-    """Return the currently uploaded context string."""
-    return uploaded_context
+def _hash_text(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def get_uploaded_context_entry(topic=None):
+    """
+    Return (context, sha256 hex digest) for a topic's context attached via /api/context,
+    otherwise for the context uploaded from a local file. Both hashes are stored with
+    their contexts, so this does not hash the text.
+    """
+    if topic:
+        context_hash = context_store.get_topic_context_hash(topic)
+        context = context_store.get_topic_context(topic) if context_hash else None
+        if context is not None:
+            return context, context_hash
+    uploaded = shared.get("context", "uploaded", "")
+    if isinstance(uploaded, str):  # Stored before hashes were kept alongside
+        return uploaded, _hash_text(uploaded)
+    return uploaded["text"], uploaded["hash"]
+
+
+def get_uploaded_context(topic=None):
+    """
+    Return the context for a topic if one was attached via /api/context,
+    otherwise the context uploaded from a local file.
+    """
+    return get_uploaded_context_entry(topic)[0]
 
 
 def save_study_data_to_file(study_data, file_path="study_output.txt"):
@@ -31,27 +63,150 @@ def save_study_data_to_file(study_data, file_path="study_output.txt"):
         with open(file_path, "w") as file:
             for section in ["content", "flashcards", "quiz", "test", "answers"]:
                 file.write(f"{section.capitalize()}:\n")
-                value = study_data.get(section) or ""
+                # Every retained round of a material, not only the latest
+                value = study_data.get_material_text(section) or ""
                 file.write(value + "\n\n")
         print(f"✅ Study material saved to {file_path}")
     except Exception as e:
         print(f"❌ Failed to save study material: {str(e)}")
 
 
+class TopicRegistry:
+    """
+    Append-only topic log (one JSON string per line) with an in-memory dedupe set.
+    Adds are a single O_APPEND write. Lines that add nothing (duplicates, or entries that
+    are not strings) are dropped by compaction once the log is larger than compact_bytes
+    or compact_interval seconds have passed since the last compaction.
+    Access is serialized across processes, and each process reads only the lines
+    appended since its last look.
+    """
+
+    def __init__(self, log_path=TOPIC_LOG, legacy_path=TOPIC_FILE, compact_bytes=TOPIC_LOG_COMPACT_BYTES,
+                 compact_interval=TOPIC_LOG_COMPACT_INTERVAL):
+        self.log_path = log_path
+        self.legacy_path = legacy_path
+        self.compact_bytes = compact_bytes
+        self.compact_interval = compact_interval
+        self._compacted_at = time.monotonic()
+        self._topics = []
+        self._seen = set()
+        self._lines = 0
+        self._offset = 0
+        self._inode = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Read the log, or only the lines other processes appended since the last read."""
+        if not os.path.exists(self.log_path):
+            if not self._loaded and os.path.exists(self.legacy_path):
+                # One-time migration from the old topics.json list
+                with open(self.legacy_path, "r") as f:
+                    for topic in json.load(f):
+                        if isinstance(topic, str):
+                            self._remember(topic)
+                self._compact()
+            self._loaded = True
+            return
+
+        stat = os.stat(self.log_path)
+        if stat.st_ino != self._inode:
+            # First load, or another process compacted the log into a new file
+            self._topics, self._seen, self._lines, self._offset = [], set(), 0, 0
+            self._inode = stat.st_ino
+        if stat.st_size > self._offset:
+            good_offset = self._offset
+            with open(self.log_path, "rb") as f:
+                f.seek(self._offset)
+                for raw in f:
+                    try:
+                        if not raw.endswith(b"\n"):
+                            raise ValueError("partial line")
+                        topic = json.loads(raw)
+                    except ValueError:
+                        # A torn write from a crash; drop it and everything after
+                        print(f"⚠️ Truncating damaged topic log at byte {good_offset}")
+                        break
+                    if isinstance(topic, str):
+                        self._remember(topic)
+                    else:
+                        # Valid JSON but not a topic (hand edits); compaction drops it
+                        print(f"⚠️ Ignoring non-string entry in topic log at byte {good_offset}")
+                    self._lines += 1
+                    good_offset += len(raw)
+            if good_offset != stat.st_size:
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(good_offset)
+            self._offset = good_offset
+        self._loaded = True
+        if self._lines > len(self._topics) and (
+            self._offset > self.compact_bytes or time.monotonic() - self._compacted_at > self.compact_interval
+        ):
+            self._compact()
+
+    def _remember(self, topic):
+        key = topic.strip().lower()
+        if not key or key in self._seen:
+            return False
+        self._seen.add(key)
+        self._topics.append(topic.strip())
+        return True
+
+    def _compact(self):
+        tmp_path = f"{self.log_path}.tmp"
+        with open(tmp_path, "w") as f:
+            for topic in self._topics:
+                f.write(json.dumps(topic) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_path)
+        self._lines = len(self._topics)
+        self._compacted_at = time.monotonic()
+        stat = os.stat(self.log_path)
+        self._inode, self._offset = stat.st_ino, stat.st_size
+
+    def add(self, topic):
+        """Record a topic; returns False if it was already registered."""
+        with self._lock, shared.lock("topic-log"):
+            self._load()
+            if not self._remember(topic):
+                return False
+            line = (json.dumps(topic.strip()) + "\n").encode()
+            fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                if self._inode is None:
+                    self._inode = os.fstat(fd).st_ino
+            finally:
+                os.close(fd)
+            self._lines += 1
+            self._offset += len(line)
+            return True
+
+    def all(self):
+        """Return registered topics in the order they were first added."""
+        with self._lock, shared.lock("topic-log"):
+            self._load()
+            return list(self._topics)
+
+    def compact(self):
+        """Rewrite the log with one line per unique topic."""
+        with self._lock, shared.lock("topic-log"):
+            self._load()
+            self._compact()
+
+
+topic_registry = TopicRegistry()
+
+
 def add_topic_to_file(topic):
-    """Append a new topic to the local topics.json file."""
-    topics = get_all_topics_from_file()
-    topics.append(topic)
-    with open(TOPIC_FILE, "w") as f:
-        json.dump(topics, f)
+    """Register a topic in the shared topic log."""
+    return topic_registry.add(topic)
 
 
 def get_all_topics_from_file():
-    """Return list of stored topics, or empty list if not found."""
-    if not os.path.exists(TOPIC_FILE):
-        return []
-    with open(TOPIC_FILE, "r") as f:
-        return json.load(f)
+    """Return list of stored topics, or empty list if none were added."""
+    return topic_registry.all()
 
 
 def load_from_server(route, topic):
@@ -62,10 +217,10 @@ def load_from_server(route, topic):
     if not topic:
         raise ValueError("Missing topic.")
 
+    from api.client import get_client  # requests is only needed by desktop callers
+
     try:
-        res = requests.get(f"http://127.0.0.1:8000/api/{route}?topic={topic}")
-        res.raise_for_status()
-        return res.text
+        return get_client().get(route, topic=topic)
     except Exception as e:
         print(f"❌ Failed to load from {route}: {e}")
         return f"Error loading {route}: {e}"
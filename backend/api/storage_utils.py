@@ -1,18 +1,357 @@
-import os, json
+import os, json, time, uuid
+
+from api.shared_state import shared
+from tracing import traced
 
 STORAGE_DIR = os.path.join(os.getcwd(), "stored_materials")
-os.makedirs(STORAGE_DIR, exist_ok=True)
+VERSIONS_DIR = os.path.join(STORAGE_DIR, "_versions")
+ITEMS_DIR = os.path.join(STORAGE_DIR, "_items")  # Parsed quiz/test/flashcard items, see api.items
+META_DIR = os.path.join(STORAGE_DIR, "_meta")  # Current version id, age and pin state per material
+os.makedirs(VERSIONS_DIR, exist_ok=True)
+os.makedirs(ITEMS_DIR, exist_ok=True)
+os.makedirs(META_DIR, exist_ok=True)
 
-def save_material(topic, material_type, content):
-    filename = os.path.join(STORAGE_DIR, f"{topic.lower()}.json")
-    data = load_material(topic) or {}
-    data[material_type] = content
-    with open(filename, "w") as f:
-        json.dump(data, f, indent=2)
+# Retention and quota settings (overridable through the environment)
+MAX_VERSIONS = int(os.getenv("MATERIAL_MAX_VERSIONS", "5"))
+MAX_VERSION_AGE_DAYS = float(os.getenv("MATERIAL_MAX_AGE_DAYS", "30"))
+MAX_STORAGE_BYTES = int(float(os.getenv("MATERIAL_MAX_STORAGE_MB", "500")) * 1024 * 1024)
+QUOTA_CHECK_INTERVAL = float(os.getenv("MATERIAL_QUOTA_CHECK_INTERVAL", "60"))
+
+_last_quota_check = 0.0
+
+
+class InvalidTopic(ValueError):
+    """Raised for a topic name that cannot be stored, such as one containing a path separator."""
+
+
+def validate_topic(topic):
+    """
+    Raises:
+        InvalidTopic: If the topic is empty, "." or "..", or contains a path separator or NUL.
+    """
+    if not topic.strip() or topic in (".", "..") or any(c in topic for c in ("/", "\\", "\x00")):
+        raise InvalidTopic(f"Invalid topic name: {topic!r}")
+
+
+def _topic_file(directory, topic):
+    """Path of a topic's file in one of the storage directories; the name never leaves it."""
+    validate_topic(topic)
+    return os.path.join(directory, f"{topic.lower()}.json")
+
+
+def _material_path(topic):
+    return _topic_file(STORAGE_DIR, topic)
+
+
+def _versions_path(topic):
+    return _topic_file(VERSIONS_DIR, topic)
+
+
+def _items_path(topic):
+    return _topic_file(ITEMS_DIR, topic)
+
+
+def _meta_path(topic):
+    return _topic_file(META_DIR, topic)
 
-def load_material(topic):
-    filename = os.path.join(STORAGE_DIR, f"{topic.lower()}.json")
-    if os.path.exists(filename):
-        with open(filename) as f:
+
+def _update_meta(topic, updates):
+    """
+    Record which version of each material is current. Cache hits read this small file
+    instead of the version history, which holds full copies of every version.
+    """
+    meta = _read_json(_meta_path(topic)) or {}
+    for material_type, (version, pinned) in updates.items():
+        meta[material_type] = {"id": version["id"], "created_at": version["created_at"], "pinned": pinned}
+    _write_json(_meta_path(topic), meta)
+
+
+def _topic_lock(topic):
+    """Name of the cross-process lock guarding a topic's material and version files."""
+    return f"material:{topic.lower()}"
+
+
+def _read_json(path):
+    if os.path.exists(path):
+        with open(path) as f:
             return json.load(f)
-    return None
\ No newline at end of file
+    return None
+
+
+def _write_json(path, data):
+    """Write JSON to a temp file and rename it over the target."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _version_summary(version):
+    return {k: v for k, v in version.items() if k != "content"}
+
+
+def save_material(topic, material_type, content, metadata=None):
+    """
+    Record a new generation of a material and make it current unless a version is pinned.
+
+    Args:
+        topic (str): The topic the material belongs to.
+        material_type (str): e.g. "flashcards", "quiz", "test" or "study_content".
+        content (str): The generated content.
+        metadata (dict): Optional generation metadata (model, prompt_hash, usage, latency_ms).
+
+    Returns:
+        dict: The stored version record without its content.
+    """
+    return save_materials(topic, {material_type: content}, metadata)[material_type]
+
+
+@traced("storage.save_materials")
+def save_materials(topic, materials, metadata=None, skip_unchanged=False):
+    """
+    Record new versions of several materials for one topic, writing each file once.
+
+    Args:
+        topic (str): The topic the materials belong to.
+        materials (dict): material_type -> content.
+        metadata (dict): Optional generation metadata applied to every version.
+        skip_unchanged (bool): Leave out materials whose content equals their latest
+            version, so re-running an import does not add versions.
+
+    Returns:
+        dict: material_type -> stored version record without its content, for the
+        materials that were saved.
+    """
+    metadata = metadata or {}
+    with shared.lock(_topic_lock(topic)):
+        versions = _read_json(_versions_path(topic)) or {}
+        current = _read_json(_material_path(topic)) or {}
+        summaries = {}
+        meta_updates = {}
+
+        for material_type, content in materials.items():
+            if skip_unchanged:
+                history = (versions.get(material_type) or {}).get("history")
+                latest = history[-1]["content"] if history else current.get(material_type)
+                if latest == content:
+                    continue
+            entry = versions.setdefault(material_type, {"pinned": None, "history": []})
+            version = {
+                "id": uuid.uuid4().hex[:12],
+                "created_at": time.time(),
+                "size": len(content),
+                "model": metadata.get("model"),
+                "prompt_hash": metadata.get("prompt_hash"),
+                "usage": metadata.get("usage"),
+                "latency_ms": metadata.get("latency_ms"),
+                "content": content,
+            }
+            entry["history"].append(version)
+            _apply_retention(entry)
+            if not entry["pinned"]:
+                current[material_type] = content
+                meta_updates[material_type] = (version, False)
+            summaries[material_type] = _version_summary(version)
+
+        if not summaries:
+            return summaries
+        _write_json(_versions_path(topic), versions)
+        _write_json(_material_path(topic), current)
+        _update_meta(topic, meta_updates)
+    enforce_storage_quota()
+    return summaries
+
+
+@traced("storage.load_material")
+def load_material(topic, touch=True):
+    filename = _material_path(topic)
+    data = _read_json(filename)
+    if data is not None and touch:
+        # Track last access for LRU eviction without touching the modification time
+        try:
+            os.utime(filename, (time.time(), os.stat(filename).st_mtime))
+        except OSError:
+            pass
+    return data
+
+
+def iter_topics():
+    """Yield the names of stored topics one at a time, without loading them."""
+    with os.scandir(STORAGE_DIR) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".json"):
+                yield entry.name[:-len(".json")]
+
+
+def _set_current(topic, material_type, content):
+    data = _read_json(_material_path(topic)) or {}
+    data[material_type] = content
+    _write_json(_material_path(topic), data)
+
+
+def _apply_retention(entry):
+    """Drop versions beyond the count limit or older than the age limit, keeping the pinned and newest ones."""
+    history = entry["history"]
+    if not history:
+        return
+    cutoff = time.time() - MAX_VERSION_AGE_DAYS * 86400
+    newest = history[-1]["id"]
+    keep = [v for v in history if v["id"] in (entry["pinned"], newest) or v["created_at"] >= cutoff]
+
+    excess = len(keep) - MAX_VERSIONS
+    if excess > 0:
+        removable = [v["id"] for v in keep if v["id"] not in (entry["pinned"], newest)][:excess]
+        keep = [v for v in keep if v["id"] not in removable]
+    entry["history"] = keep
+
+
+def list_versions(topic, material_type):
+    """Return the version history (without content) and the pinned version id for a material."""
+    versions = _read_json(_versions_path(topic)) or {}
+    entry = versions.get(material_type, {"pinned": None, "history": []})
+    return {
+        "pinned": entry["pinned"],
+        "versions": [_version_summary(v) for v in entry["history"]],
+    }
+
+
+def material_info(topic, material_type):
+    """
+    The current version's id, creation time and pin state, or None if the material has no
+    versions. Topics saved before this summary existed fall back to the version history.
+    """
+    meta = _read_json(_meta_path(topic))
+    if meta is not None and material_type in meta:
+        return meta[material_type]
+    versions = _read_json(_versions_path(topic)) or {}
+    entry = versions.get(material_type)
+    if entry and entry["history"]:
+        current = next((v for v in entry["history"] if v["id"] == entry["pinned"]), entry["history"][-1])
+        return {"id": current["id"], "created_at": current["created_at"], "pinned": bool(entry["pinned"])}
+    return None
+
+
+def material_age(topic, material_type):
+    """
+    Seconds since the current content of a material was generated, or None if it is not stored.
+    Falls back to the topic file's modification time for materials saved before versioning.
+    """
+    info = material_info(topic, material_type)
+    if info is not None:
+        return time.time() - info["created_at"]
+    path = _material_path(topic)
+    if os.path.exists(path):
+        return time.time() - os.path.getmtime(path)
+    return None
+
+
+def _select_version(topic, material_type, version_id, pin):
+    with shared.lock(_topic_lock(topic)):
+        versions = _read_json(_versions_path(topic)) or {}
+        entry = versions.get(material_type)
+        if not entry:
+            raise KeyError(f"No versions stored for {topic}/{material_type}")
+        match = next((v for v in entry["history"] if v["id"] == version_id), None)
+        if match is None:
+            raise KeyError(f"Unknown version {version_id} for {topic}/{material_type}")
+
+        entry["pinned"] = version_id if pin else None
+        _write_json(_versions_path(topic), versions)
+        _set_current(topic, material_type, match["content"])
+        _update_meta(topic, {material_type: (match, pin)})
+        return _version_summary(match)
+
+
+def pin_version(topic, material_type, version_id):
+    """Make a version current and keep it current until unpinned."""
+    return _select_version(topic, material_type, version_id, pin=True)
+
+
+def rollback_version(topic, material_type, version_id):
+    """Make a version current; the next generation replaces it again."""
+    return _select_version(topic, material_type, version_id, pin=False)
+
+
+def unpin_version(topic, material_type):
+    """Release a pin and make the newest version current again."""
+    with shared.lock(_topic_lock(topic)):
+        versions = _read_json(_versions_path(topic)) or {}
+        entry = versions.get(material_type)
+        if entry and entry["pinned"]:
+            latest = entry["history"][-1]
+            entry["pinned"] = None
+            _write_json(_versions_path(topic), versions)
+            _set_current(topic, material_type, latest["content"])
+            _update_meta(topic, {material_type: (latest, False)})
+
+
+def _has_pinned(topic):
+    """Whether any material of a topic is pinned; read from the small meta file when there is one."""
+    meta = _read_json(_meta_path(topic))
+    if meta is not None:
+        return any(info.get("pinned") for info in meta.values())
+    versions = _read_json(_versions_path(topic)) or {}
+    return any(entry.get("pinned") for entry in versions.values())
+
+
+def storage_usage():
+    """Return total bytes used by stored materials and their version histories."""
+    total = 0
+    for directory in (STORAGE_DIR, VERSIONS_DIR, ITEMS_DIR, META_DIR):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                total += os.path.getsize(path)
+    return total
+
+
+def enforce_storage_quota(force=False):
+    """
+    Evict least recently used topics until storage fits in MAX_STORAGE_BYTES. Topics with
+    a pinned version are never evicted: a pin is an explicit request to keep that content.
+    Checks are throttled to once per QUOTA_CHECK_INTERVAL seconds across all processes unless forced.
+    """
+    global _last_quota_check
+    now = time.time()
+    if not force and now - _last_quota_check < QUOTA_CHECK_INTERVAL:
+        return []
+    _last_quota_check = now
+    if not force and not shared.claim("storage", "quota-check", os.getpid(), QUOTA_CHECK_INTERVAL):
+        return []
+    shared.purge_expired()  # Piggyback expired shared-state cleanup on the throttled check
+
+    topics = []
+    total = 0
+    for name in os.listdir(STORAGE_DIR):
+        path = os.path.join(STORAGE_DIR, name)
+        if not name.endswith(".json") or not os.path.isfile(path):
+            continue
+        related = [path, *(os.path.join(directory, name) for directory in (VERSIONS_DIR, ITEMS_DIR, META_DIR))]
+        size = sum(os.path.getsize(p) for p in related if os.path.exists(p))
+        topics.append((os.stat(path).st_atime, related, size))
+        total += size
+
+    evicted = []
+    for _, related, size in sorted(topics):
+        if total <= MAX_STORAGE_BYTES:
+            break
+        topic = os.path.basename(related[0])[:-len(".json")]
+        # A topic that is being written right now is not least recently used; skip it
+        # rather than wait, since the caller may hold another topic's lock
+        release = shared.try_lock(_topic_lock(topic))
+        if release is None:
+            continue
+        try:
+            if _has_pinned(topic):
+                continue
+            for p in related:
+                if os.path.exists(p):
+                    os.remove(p)
+        finally:
+            release()
+        total -= size
+        evicted.append(topic)
+
+    if evicted:
+        print(f"🧹 Evicted {len(evicted)} topic(s) to stay within storage quota")
+    return evicted
@@ -0,0 +1,106 @@
+"""
+Offline study packs and delta sync for mobile clients.
+
+A study pack bundles every stored material of a topic (plus the parsed items of quizzes,
+tests and flashcards) with a version vector: material -> content ETag. A returning client
+posts its vector to /api/sync and receives only what changed. Item materials come back as
+item-level deltas when the server still knows the client's version, otherwise whole.
+Nothing here generates content or calls the model: missing materials are absent from the
+pack, and flashcards whose items (options) were not built yet come without "items".
+"""
+import gzip
+import json
+
+import api.storage_utils as storage_utils
+from api import items
+from api.materials import material_etag
+
+MATERIALS = ("study_content", "flashcards", "quiz", "test")
+
+
+def _stored(topic):
+    """Current stored content of a topic's materials."""
+    data = storage_utils.load_material(topic) or {}
+    return {material: data[material] for material in MATERIALS if data.get(material)}
+
+
+def version_vector(topic):
+    """Return material -> ETag for the topic's stored materials."""
+    return {material: material_etag(content) for material, content in _stored(topic).items()}
+
+
+def _full_section(topic, material, content):
+    section = {"etag": material_etag(content), "content": content}
+    if material in items.ITEM_MATERIALS:
+        parsed = items.built_items(topic, material, content)
+        if parsed is not None:
+            section["items"] = parsed
+    return section
+
+
+def build_pack(topic):
+    """
+    Every stored material of a topic in one payload.
+
+    Returns:
+        dict: {"topic", "versions", "materials": {material: {"etag", "content", "items"?}}}
+    """
+    materials = {material: _full_section(topic, material, content)
+                 for material, content in _stored(topic).items()}
+    return {
+        "topic": topic,
+        "versions": {material: section["etag"] for material, section in materials.items()},
+        "materials": materials,
+    }
+
+
+def sync(topic, client_versions):
+    """
+    What changed since the client's version vector.
+
+    Args:
+        topic (str): The topic to sync.
+        client_versions (dict): material -> ETag the client holds.
+
+    Returns:
+        dict: {"topic", "versions", "changed", "removed"}. Each changed material is either a
+        full section (as in build_pack) or, for item materials, a delta:
+        {"etag", "base", "order": [keys], "upserts": [items], "removed": [keys]}.
+    """
+    stored = _stored(topic)
+    changed = {}
+    for material, content in stored.items():
+        etag = material_etag(content)
+        base = client_versions.get(material)
+        if base == etag:
+            continue
+        base_keys = items.item_keys(topic, material, base) if base and material in items.ITEM_MATERIALS else None
+        current = items.built_items(topic, material, content) if base_keys is not None else None
+        if current is None:
+            changed[material] = _full_section(topic, material, content)
+            continue
+        known = set(base_keys)
+        current_keys = [item["key"] for item in current]
+        changed[material] = {
+            "etag": etag,
+            "base": base,
+            "order": current_keys,
+            "upserts": [item for item in current if item["key"] not in known],
+            "removed": sorted(known - set(current_keys)),
+        }
+    return {
+        "topic": topic,
+        "versions": {material: material_etag(content) for material, content in stored.items()},
+        "changed": changed,
+        "removed": sorted(set(client_versions) - set(stored)),
+    }
+
+
+def compress(payload):
+    """Serialize a pack or sync payload as gzipped JSON."""
+    return gzip.compress(json.dumps(payload, separators=(",", ":")).encode(), compresslevel=6)
+
+
+def pack_etag(versions):
+    """ETag of a pack, derived from its version vector."""
+    return material_etag(json.dumps(versions, sort_keys=True))
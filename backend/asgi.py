@@ -0,0 +1,273 @@
+"""
+ASGI entry point for the material routes.
+
+Material routes (/api/study_content, /api/flashcards, /api/quiz, /api/test) are
+handled by async handlers that read cached materials off the event loop and coalesce
+identical (topic, material) generations into one upstream call. The generation itself is
+still the blocking OpenAI call: it runs on a bounded thread pool, so every distinct
+pending generation holds one pool thread, sized by default to the admission limits
+(running plus queued generations). Requests beyond that wait in the pool's queue.
+Generations go through materials.generate_once, so they take the same admission slots
+and cross-process locks as the Flask routes. CORS matches flask-cors on /api/*.
+Every other route is served by the existing Flask app through asgiref.
+
+Run with:
+    python asgi.py
+or:
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import functools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from contextvars import copy_context
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+from api import app as flask_app
+from api import items, routes
+import api.storage_utils as storage_utils
+from api.admission import admission, client_key, AdmissionRejected
+from api.materials import generate_once, load_cached, material_etag, is_stale, refresh_in_background
+import progress
+import tracing
+
+# A generation holds a pool thread while it runs or waits for an admission slot
+GENERATION_THREADS = int(os.getenv("ASGI_GENERATION_THREADS",
+                                   str(admission.max_concurrent + admission.max_queue)))
+MAX_BODY_BYTES = 1024 * 1024
+
+# Route -> allowed methods, matching the Flask routes
+MATERIAL_ROUTES = {
+    "/api/study_content": ("POST",),
+    "/api/flashcards": ("GET", "POST"),
+    "/api/quiz": ("GET", "POST"),
+    "/api/test": ("GET", "POST"),
+}
+
+_executor = ThreadPoolExecutor(max_workers=GENERATION_THREADS, thread_name_prefix="generation")
+_inflight = {}
+_flask_asgi = WsgiToAsgi(flask_app)
+
+
+async def _run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(copy_context().run, func, *args))
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send(send, status, body, content_type="text/html; charset=utf-8", headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode()),
+                    *headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status, payload, headers=()):
+    await _send(send, status, json.dumps(payload).encode(), "application/json", headers)
+
+
+async def _generate_coalesced(topic, material, session_id):
+    """Generate a material, sharing one in-flight generation between identical requests."""
+    key = (topic.lower(), material)
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_generate(topic, material, session_id))
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(future)
+
+
+def _revalidate(topic, material, client, session_id):
+    """Schedule a background refresh of a stale material; the client is charged only if one starts."""
+    # Commit once the refresh has written to the session, as the Flask teardown does for requests
+    refresh_in_background(topic, material, routes.sessions.get(session_id),
+                          on_done=lambda: routes.sessions.commit(session_id), client=client)
+
+
+async def _generate(topic, material, session_id):
+    # generate_once takes an admission slot and the cross-process generation lock, so
+    # generations from this server and the Flask one share the same limits
+    study_data = await _run_blocking(routes.sessions.get, session_id)
+    try:
+        content, _ = await _run_blocking(generate_once, topic, material, study_data)
+        return content
+    finally:
+        await _run_blocking(routes.sessions.commit, session_id)
+
+
+async def handle_material(scope, receive, send):
+    path, method = scope["path"], scope["method"]
+    material = path.rsplit("/", 1)[-1]
+    if method not in MATERIAL_ROUTES[path]:
+        await _send_json(send, 405, {"error": "Method not allowed"})
+        return
+
+    query = {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+    headers = {k.decode().lower(): v.decode() for k, v in scope.get("headers", [])}
+    try:
+        body = await _read_body(receive)
+        payload = json.loads(body) if method == "POST" and body else {}
+    except ValueError as e:
+        await _send_json(send, 400, {"error": str(e)})
+        return
+    if not isinstance(payload, dict):
+        await _send_json(send, 400, {"error": "Request body must be a JSON object"})
+        return
+
+    topic = (payload.get("topic") if method == "POST" else query.get("topic")) or ""
+    if not isinstance(topic, str):
+        await _send_json(send, 400, {"error": "topic must be a string"})
+        return
+    topic = topic.strip()
+    if not topic:
+        await _send_json(send, 400, {"error": "Missing topic"})
+        return
+    try:
+        storage_utils.validate_topic(topic)
+    except storage_utils.InvalidTopic as e:
+        await _send_json(send, 400, {"error": str(e)})
+        return
+    try:
+        paging = items.paging_args(query) if material in items.ITEM_MATERIALS else None
+    except ValueError as e:
+        await _send_json(send, 400, {"error": str(e)})
+        return
+
+    force = query.get("force", "false").lower() == "true"
+    # Rate limits are charged to the remote address; the session id only selects session data
+    client = client_key((scope.get("client") or [None])[0])
+    session_id = headers.get("x-session-id") or query.get("session_id") or client
+
+    content = None if force else await _run_blocking(load_cached, topic, material)
+    cache_headers = []
+    if content is None:
+        try:
+            admission.check_rate(client, force)
+            content = await _generate_coalesced(topic, material, session_id)
+        except AdmissionRejected as e:
+            await _send_json(send, 429, {"error": e.reason, "retry_after": e.retry_after},
+                             [(b"retry-after", str(e.retry_after).encode())])
+            return
+        cache_headers.append((b"x-cache", b"MISS"))
+    else:
+        refresh = query.get("refresh", "false").lower() == "true"
+        stale, age = await _run_blocking(is_stale, topic, material, refresh)
+        if stale:
+            await _run_blocking(_revalidate, topic, material, client, session_id)
+        cache_headers.append((b"x-cache", b"STALE" if stale else b"HIT"))
+        if age is not None:
+            cache_headers.append((b"age", str(int(age)).encode()))
+
+    etag = material_etag(content)
+    etag_header = [(b"etag", f'"{etag}"'.encode()), *cache_headers]
+    if_none_match = headers.get("if-none-match", "")
+    if etag in [tag.strip().strip('"') for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        await send({"type": "http.response.start", "status": 304, "headers": etag_header})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    if paging is None and material != "flashcards":
+        await _send(send, 200, content.encode(), headers=etag_header)
+        return
+    try:
+        # Building flashcard items calls the model, so it is admitted like a generation
+        if paging is not None:
+            status, body = await _run_blocking(items.render, topic, material, content, paging, client)
+        else:
+            status, body = 200, await _run_blocking(items.get_items, topic, material, content, client)
+    except AdmissionRejected as e:
+        await _send_json(send, 429, {"error": e.reason, "retry_after": e.retry_after},
+                         [(b"retry-after", str(e.retry_after).encode())])
+        return
+    await _send_json(send, status, body, etag_header)
+
+
+def _with_cors(send):
+    """Add the CORS header flask-cors adds to /api/* responses on the Flask side."""
+    async def wrapped(message):
+        if message["type"] == "http.response.start":
+            message["headers"] = [*message.get("headers", []), (b"access-control-allow-origin", b"*")]
+        await send(message)
+    return wrapped
+
+
+async def _preflight(scope, send):
+    """Answer a CORS preflight for a material route the way flask-cors would."""
+    headers = dict(scope.get("headers", []))
+    methods = ", ".join((*MATERIAL_ROUTES[scope["path"]], "OPTIONS"))
+    response_headers = [
+        (b"access-control-allow-origin", b"*"),
+        (b"access-control-allow-methods", methods.encode()),
+        (b"content-length", b"0"),
+    ]
+    requested = headers.get(b"access-control-request-headers")
+    if requested:
+        response_headers.append((b"access-control-allow-headers", requested))
+    await send({"type": "http.response.start", "status": 200, "headers": response_headers})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def _with_request_id(send, trace):
+    """Add the trace's X-Request-Id header to the response start message."""
+    if trace is None:
+        return send
+
+    async def wrapped(message):
+        if message["type"] == "http.response.start":
+            message["headers"] = [*message.get("headers", []), (b"x-request-id", trace.request_id.encode())]
+        await send(message)
+    return wrapped
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await _run_blocking(routes.build_static_index)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            routes.sessions.close()
+            _executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] in MATERIAL_ROUTES and scope["method"] == "OPTIONS":
+        await _preflight(scope, send)
+    elif scope["type"] == "http" and scope["path"] in MATERIAL_ROUTES:
+        headers = dict(scope.get("headers", []))
+        request_id = headers.get(b"x-request-id", b"").decode() or None
+        progress_id = headers.get(b"x-progress-id", b"").decode() or None
+        with tracing.start_trace(f"{scope['method']} {scope['path']}", request_id) as trace, \
+                (progress.report_to(progress_id) if progress_id else nullcontext()):
+            await handle_material(scope, receive, _with_cors(_with_request_id(send, trace)))
+    else:
+        await _flask_asgi(scope, receive, send)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.getenv("PORT", "8000"))
+    print(f"🚀 Starting ASGI app with Uvicorn on http://0.0.0.0:{port}")
+    uvicorn.run(app, host="0.0.0.0", port=port, backlog=4096, timeout_keep_alive=30)
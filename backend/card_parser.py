@@ -0,0 +1,159 @@
+"""
+Incremental parser for generated flashcards, quiz questions and distractor lists.
+
+Text can be fed in arbitrary chunks (e.g. streamed completion deltas); each card is
+returned as soon as it is complete rather than after the whole response arrives.
+Recognized formats, which may be mixed:
+
+    Q: ... / A: ...                         (also "Question:" / "Answer:", "Q1:" / "A1:")
+    1. ... / 2) ...                         numbered questions
+    A. ... / b) ... / - ...                 lettered or bulleted options, ✔ marks the correct one
+    Question: ... / Correct: ... / Choices: the distractor format
+
+Cards are dicts: {"question": str, "answer": str or None, "options": [str, ...]}.
+In a "Q:" card, numbered lines after its answer continue the answer (a listed answer)
+rather than starting numbered questions.
+"""
+import re
+
+QUESTION_LINE = re.compile(r"^(?:Q(?:uestion)?\s*\d*\s*[:.)]|\d+\s*[.)])\s*(.*)$", re.IGNORECASE)
+ANSWER_LINE = re.compile(r"^(?:A\s*\d*\s*:|Answer\s*[:\-]|Correct(?:\s+answer)?\s*[:\-])\s*(.*)$", re.IGNORECASE)
+# "A. text" / "b) text"; the lookahead keeps abbreviations such as "e. g. text" out
+OPTION_LINE = re.compile(r"^(?:([A-Fa-f])[.)](?!\s*[A-Za-z]\.)|[-*•])\s+(.*)$")
+CHOICES_LINE = re.compile(r"^(?:Choices|Options)\s*:\s*$", re.IGNORECASE)
+OPTION_PREFIX = re.compile(r"^(?:incorrect\s+option|distractor)\s*(?:\d+\s*)?[:\-.)]?\s*", re.IGNORECASE)
+CORRECT_MARK = re.compile(r"\s*(?:✔|✓|\(correct\))\s*", re.IGNORECASE)
+
+
+def _clean(text):
+    return text.replace("**", "").strip()
+
+
+def clean_option(text):
+    """Strip list noise such as "Distractor 2:" or "Incorrect Option 1 -" from an option."""
+    return OPTION_PREFIX.sub("", _clean(text)).strip()
+
+
+class CardParser:
+    """
+    Feed text with feed(); it returns the cards completed by that chunk. Call close()
+    at the end of the text for the last card.
+
+    A card is complete when the next question starts, or at a blank line once it has an
+    answer and either options or a Q/A-style "A:"/"Answer:" line (so a blank line between
+    "Correct:" and its "Choices:" does not cut the card short).
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._card = None
+        self._labels = {}  # Option letter -> text, to resolve "Answer: B"
+        self._qa_style = False
+        self._labeled = False  # The current card started with "Q:"/"Question:", not a number
+        self.count = 0
+
+    @property
+    def current(self):
+        """The card being built, or None between cards."""
+        return self._card
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        done = []
+        for line in lines:
+            card = self._line(line)
+            if card:
+                done.append(card)
+        return done
+
+    def close(self):
+        done = []
+        if self._buffer:
+            card = self._line(self._buffer)
+            self._buffer = ""
+            if card:
+                done.append(card)
+        card = self._finish()
+        if card:
+            done.append(card)
+        return done
+
+    def _line(self, raw):
+        line = _clean(raw.strip().lstrip("#").strip())
+        if not line:
+            card = self._card
+            if card and card["answer"] and (card["options"] or self._qa_style):
+                return self._finish()
+            return None
+
+        card = self._card
+        question = QUESTION_LINE.match(line)
+        if question and not OPTION_LINE.match(line):
+            numbered = line[0].isdigit()
+            if numbered and card and self._labeled and card["answer"] is not None and not card["options"]:
+                card["answer"] = f"{card['answer']}\n{line}".strip()  # Numbered list inside an answer
+                return None
+            finished = self._finish()
+            self._card = {"question": _clean(question.group(1)), "answer": None, "options": []}
+            self._labeled = not numbered
+            return finished
+
+        if card is None or CHOICES_LINE.match(line):
+            return None
+
+        answer = ANSWER_LINE.match(line)
+        if answer:
+            text = _clean(answer.group(1))
+            card["answer"] = self._labels.get(text.rstrip(".)").upper(), text)
+            self._qa_style = self._qa_style or not line.lower().startswith("correct")
+            return None
+
+        option = OPTION_LINE.match(line)
+        if option:
+            text = option.group(2)
+            if CORRECT_MARK.search(text):
+                text = CORRECT_MARK.sub(" ", text)
+                card["answer"] = clean_option(text)
+            text = clean_option(text)
+            if option.group(1):
+                self._labels[option.group(1).upper()] = text
+            card["options"].append(text)
+        elif card["answer"] is None and not card["options"]:
+            card["question"] = f"{card['question']} {line}".strip()  # Wrapped question
+        elif card["answer"] is not None and not card["options"]:
+            card["answer"] = f"{card['answer']} {line}".strip()  # Wrapped answer
+        return None
+
+    def _finish(self):
+        card, self._card = self._card, None
+        self._labels, self._qa_style, self._labeled = {}, False, False
+        if not card or not card["question"]:
+            return None
+        self.count += 1
+        return card
+
+
+def iter_cards(chunks):
+    """Yield cards from an iterable of text chunks as soon as each one is complete."""
+    parser = CardParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def parse_cards(text):
+    """Parse a complete text into cards."""
+    return list(iter_cards([text]))
+
+
+def parse_choices(text):
+    """Option lines ("- ...", "A. ...") anywhere in a text, cleaned; for bare distractor lists."""
+    choices = []
+    for line in text.splitlines():
+        option = OPTION_LINE.match(_clean(line))
+        if option:
+            choice = clean_option(CORRECT_MARK.sub(" ", option.group(2)))
+            if choice:
+                choices.append(choice)
+    return choices
@@ -1,42 +1,38 @@
 import json
-import re
+from random import shuffle
 
-cards = []
+from card_parser import clean_option, parse_cards
+from tracing import traced
 
+@traced("cards.extract_for_web_ui")
 def extract_cards_for_web_ui(text):
-    from study_content import generate_batch_mock_answers
+    from study_core import generate_batch_mock_answers
 
     cards = []
-    raw_pairs = []
+    parsed = [card for card in parse_cards(text) if card["answer"]]
 
-    blocks = text.strip().split("\n\n")
-
-    for block in blocks:
-        lines = block.strip().split("\n")
-        if len(lines) == 2 and lines[0].startswith("Q:") and lines[1].startswith("A:"):
-            question = lines[0][2:].strip()
-            answer = lines[1][2:].strip()
-            raw_pairs.append({"question": question, "answer": answer})
-
-    # ✅ Stop here if raw_pairs is empty
-    if not raw_pairs:
+    # ✅ Stop here if nothing parsed
+    if not parsed:
         print("❌ No valid Q/A pairs found. Skipping card generation.")
         return []
 
-    # Generate distractors
+    # Generate distractors for plain Q/A cards; multiple-choice cards already have options
+    raw_pairs = [{"question": card["question"], "answer": card["answer"]}
+                 for card in parsed if len(card["options"]) < 2]
     try:
-        distractor_map = generate_batch_mock_answers(raw_pairs)
+        distractor_map = generate_batch_mock_answers(raw_pairs) if raw_pairs else {}
     except Exception as e:
         print("⚠️ GPT fallback:", e)
         distractor_map = {pair["question"]: ["Wrong 1", "Wrong 2", "Wrong 3"] for pair in raw_pairs}
 
-    for pair in raw_pairs:
-        q = pair["question"]
-        a = pair["answer"]
-        distractors = distractor_map.get(q, ["Wrong 1", "Wrong 2", "Wrong 3"])
-        clean_distractors = [re.sub(r"^Distractor \d+: ", "", d).strip() for d in distractors]
-        options = list(set(clean_distractors + [a]))
-        from random import shuffle
+    for card in parsed:
+        q = card["question"]
+        a = card["answer"]
+        if len(card["options"]) >= 2:
+            distractors = card["options"]
+        else:
+            distractors = distractor_map.get(q, ["Wrong 1", "Wrong 2", "Wrong 3"])
+        options = list(dict.fromkeys([clean_option(d) for d in distractors] + [a]))
         shuffle(options)
 
         cards.append({
@@ -47,12 +43,11 @@ def extract_cards_for_web_ui(text):
 
     return cards
 
-def save_all_web_card_data():
-    with open("ui_layout.json", "w") as f:
+def save_all_web_card_data(cards, path="ui_layout.json"):
+    """Write a card layout to a file (for scripts; the server keeps layouts in api.items)."""
+    with open(path, "w") as f:
         json.dump(cards, f, indent=2)
 
-def build_web_ui_from_file():
-    global cards
-    with open("ui_layout.json", "r") as f:
-        cards = json.load(f)
-    return cards
\ No newline at end of file
+def build_web_ui_from_file(path="ui_layout.json"):
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,77 @@
+"""
+Measure cold-start import time of the server entry points.
+
+Each module is imported in a fresh interpreter several times; the median wall time is
+reported along with the slowest imports from Python's -X importtime log, so regressions
+(a heavy dependency creeping back into module scope) are easy to spot.
+
+Usage (from the backend directory):
+    python import_benchmark.py [--runs 5] [--top 15] [module ...]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_MODULES = ["api", "asgi", "main"]
+# Imports that must never happen when only serving HTTP
+FORBIDDEN_IN_SERVER = ["customtkinter", "tkinter", "ui", "openai"]
+
+
+def time_import(module):
+    """Import a module in a fresh interpreter; returns (seconds, importtime log, loaded modules)."""
+    code = f"import sys, {module}; print(','.join(sorted(sys.modules)))"
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    loaded = set(result.stdout.strip().splitlines()[-1].split(","))
+    return elapsed, result.stderr, loaded
+
+
+def slowest_imports(log, top):
+    """Parse -X importtime output into the top (cumulative_us, module) entries."""
+    entries = []
+    for line in log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        entries.append((int(cumulative), name.strip()))
+    return sorted(entries, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import time.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        timings, log, loaded = [], "", set()
+        for _ in range(args.runs):
+            elapsed, log, loaded = time_import(module)
+            timings.append(elapsed)
+        print(f"\n⏱️ import {module}: median {statistics.median(timings) * 1000:.0f} ms "
+              f"(min {min(timings) * 1000:.0f} ms, {len(loaded)} modules loaded)")
+        for cumulative, name in slowest_imports(log, args.top):
+            print(f"    {cumulative / 1000:8.1f} ms  {name}")
+
+        leaked = [name for name in FORBIDDEN_IN_SERVER if name in loaded]
+        if leaked:
+            failed = True
+            print(f"❌ {module} imports {', '.join(leaked)} at startup")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Opt-in CPU and memory profiling for individual requests.
+
+A request is profiled when PROFILING_ENABLED=1 and it sends "X-Profile: 1" or ?profile=1
+(matching PROFILING_TOKEN if one is configured), or when it is picked by
+PROFILE_SAMPLE_RATE. Each profile writes three files to PROFILE_DIR:
+    <id>.prof  cProfile stats (open with pstats or snakeviz)
+    <id>.txt   top functions by cumulative time and top allocation sites
+    <id>.json  metadata used by the /api/debug/profiles listing
+Only the newest PROFILE_MAX_COUNT profiles are kept.
+
+cProfile only records the thread that enables it, so work a request hands to a thread
+pool is recorded by wrapping it in run(): submit copy_context().run, profiling.run, fn,
+... and the worker's calls are merged into the request's profile. (On Python 3.12+ the
+request's profiler already sees every thread, and run() just calls fn.) tracemalloc is
+process-wide, so one request is profiled at a time, requests arriving meanwhile run
+unprofiled, and allocation stats can include work done by concurrent requests.
+
+The /api/debug/profiles endpoints need PROFILING_TOKEN (as X-Debug-Token) when it is set.
+"""
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.path.join(os.getcwd(), "profiles")
+PROFILE_MAX_COUNT = int(os.getenv("PROFILE_MAX_COUNT", "50"))
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+_active = threading.Lock()
+_current = ContextVar("request_profile", default=None)
+
+
+def should_profile(flag=None):
+    """
+    Decide whether to profile a request, given the value of its X-Profile header or ?profile=.
+    """
+    if flag and PROFILING_ENABLED:
+        if PROFILING_TOKEN:
+            return flag == PROFILING_TOKEN
+        return flag.lower() in ("1", "true")
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def debug_access_allowed(token=None):
+    """
+    Whether a caller may read the /api/debug/ endpoints (traces and profiles): with
+    PROFILING_TOKEN set the token must match it, otherwise profiling must be switched on
+    (PROFILING_ENABLED=1 or a PROFILE_SAMPLE_RATE).
+    """
+    if PROFILING_TOKEN:
+        # Compared as bytes: compare_digest rejects str arguments with non-ASCII characters
+        return bool(token) and hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+    return PROFILING_ENABLED or PROFILE_SAMPLE_RATE > 0
+
+
+class RequestProfile:
+    def __init__(self, name, request_id=None):
+        self.name = name
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{_safe_id(request_id or os.urandom(4).hex())}"
+        self.started_at = time.time()
+        self.profiler = cProfile.Profile()
+        self.start_snapshot = None
+        self.started_tracemalloc = False
+        self.worker_profilers = []  # Finished profilers of pool work run for this request
+        self.stopped = False
+        self.context_token = None  # Restores the previous current profile in end_profile
+        self._workers_lock = threading.Lock()
+
+    def add_worker(self, profiler):
+        with self._workers_lock:
+            if not self.stopped:
+                self.worker_profilers.append(profiler)
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        self.start_snapshot = tracemalloc.take_snapshot()
+        self.start_time = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self, **meta):
+        self.profiler.disable()
+        duration = time.perf_counter() - self.start_time
+        with self._workers_lock:
+            self.stopped = True
+            workers = list(self.worker_profilers)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, self.id)
+        report = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=report)
+        for worker in workers:
+            stats.add(worker)
+        stats.dump_stats(f"{base}.prof")
+
+        report.write(f"{self.name}  ({duration * 1000:.1f} ms, {len(workers)} pool task(s))\n\n")
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        report.write("\nTop allocation sites during the request:\n")
+        allocations = snapshot.compare_to(self.start_snapshot, "lineno")
+        for stat in allocations[:TOP_ALLOCATIONS]:
+            report.write(f"{stat}\n")
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+
+        summary = {
+            "id": self.id,
+            "name": self.name,
+            "created_at": self.started_at,
+            "duration_ms": round(duration * 1000, 2),
+            "allocated_bytes": sum(stat.size_diff for stat in allocations if stat.size_diff > 0),
+            "peak_traced_bytes": peak,
+            **meta,
+        }
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f)
+        _rotate()
+        return summary
+
+
+def begin_profile(name, request_id=None):
+    """
+    Start profiling the current request. Returns the profile to pass to end_profile,
+    or None if another request is already being profiled.
+    """
+    if not _active.acquire(blocking=False):
+        return None
+    try:
+        profile = RequestProfile(name, request_id)
+        profile.start()
+        profile.context_token = _current.set(profile)
+        return profile
+    except Exception:
+        _active.release()
+        raise
+
+
+def end_profile(profile, **meta):
+    if profile is None:
+        return None
+    try:
+        summary = profile.stop(**meta)
+        print(f"🔬 Profiled {profile.name} in {summary['duration_ms']} ms -> {profile.id}")
+        return summary
+    except Exception as e:
+        print(f"❌ Could not write profile {profile.id}: {e}")
+        return None
+    finally:
+        _reset_current(profile)
+        _active.release()
+
+
+def _reset_current(profile):
+    if profile.context_token is None:
+        return
+    try:
+        _current.reset(profile.context_token)
+    except ValueError:
+        # Ended from a different context than it began in (e.g. after a streamed response)
+        if _current.get() is profile:
+            _current.set(None)
+    profile.context_token = None
+
+
+def run(func, *args, **kwargs):
+    """
+    Call func, recording it in the current request's profile if there is one. Meant for
+    pool workers started with copy_context().run, which carries the request's profile.
+    """
+    profile = _current.get()
+    if profile is None or profile.stopped:
+        return func(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is active in this process (3.12+): it already records this thread
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profile.add_worker(profiler)
+
+
+def list_profiles():
+    """Metadata of stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return sorted(profiles, key=lambda p: p.get("created_at", 0), reverse=True)
+
+
+def _rotate():
+    for stale in list_profiles()[PROFILE_MAX_COUNT:]:
+        for extension in (".prof", ".txt", ".json"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, stale["id"] + extension))
+            except OSError:
+                pass
+
+
+def _safe_id(value):
+    return re.sub(r"[^A-Za-z0-9_-]", "", value)[:64] or "request"
@@ -0,0 +1,186 @@
+"""
+Step-level progress events for long generations.
+
+A client picks a progress id, sends it as X-Progress-Id (or ?progress_id=) with the request
+that does the work, and listens on GET /api/progress/<id> as server-sent events. While that
+request runs, emit() calls anywhere underneath it (including pool threads started with
+copy_context().run) publish to the channel. The channel is closed with a "complete" or
+"error" event when the request finishes. A listener on an id that no work attaches to
+(unknown, mistyped or long finished) gives up after PROGRESS_IDLE_TIMEOUT seconds.
+
+In-process callers (the desktop app, scripts) can use report_to(listener=...) to receive
+the same events as callbacks.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+PROGRESS_TTL = float(os.getenv("PROGRESS_TTL", "300"))
+# How long a listener waits for work to attach to its channel (or to publish) before giving up
+IDLE_TIMEOUT = float(os.getenv("PROGRESS_IDLE_TIMEOUT", "30"))
+MAX_EVENTS_PER_CHANNEL = 1000
+KEEPALIVE_SECONDS = 15
+
+_current = ContextVar("progress_channel", default=None)
+
+
+class ProgressChannel:
+    def __init__(self, channel_id=None, listener=None):
+        self.id = channel_id
+        self.events = deque(maxlen=MAX_EVENTS_PER_CHANNEL)
+        self.closed = False
+        self.updated = time.monotonic()
+        self.listener = listener
+        self.workers = 0  # Requests currently publishing to the channel
+        self.listeners = 0  # Open streams on the channel
+        self._next_id = 1
+        self._changed = threading.Condition()
+
+    def publish(self, event, data):
+        with self._changed:
+            if self.closed:
+                return None
+            record = {"id": self._next_id, "event": event, "data": data, "time": time.time()}
+            self._next_id += 1
+            self.events.append(record)
+            self.updated = time.monotonic()
+            self._changed.notify_all()
+        if self.listener:
+            try:
+                self.listener(record)
+            except Exception as e:
+                print(f"⚠️ Progress listener failed: {e}")
+        return record
+
+    def close(self, event="complete", **data):
+        self.publish(event, data)
+        with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+
+    def read(self, after, timeout):
+        """Wait up to timeout for events newer than `after`; returns (events, closed)."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.closed or (self.events and self.events[-1]["id"] > after), timeout)
+            return [e for e in self.events if e["id"] > after], self.closed
+
+
+class ProgressBus:
+    """Named progress channels shared between the working request and its listeners."""
+
+    def __init__(self, ttl=PROGRESS_TTL):
+        self.ttl = ttl
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.ttl
+        for channel_id, channel in list(self._channels.items()):
+            if channel.updated < cutoff and not channel.workers and not channel.listeners:
+                del self._channels[channel_id]
+
+    def _track(self, channel_id, field, delta):
+        """Adjust a channel's worker or listener count; returns the channel."""
+        with self._lock:
+            self._prune()
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                channel = self._channels[channel_id] = ProgressChannel(channel_id)
+            setattr(channel, field, getattr(channel, field) + delta)
+            channel.updated = time.monotonic()
+            return channel
+
+    def open(self, channel_id):
+        """The channel a working request publishes to; release it with done()."""
+        return self._track(channel_id, "workers", 1)
+
+    def done(self, channel):
+        self._track(channel.id, "workers", -1)
+
+    def stream(self, channel_id, last_event_id=0, idle_timeout=IDLE_TIMEOUT):
+        """
+        Yield events for a channel as they arrive, or None every KEEPALIVE_SECONDS while idle.
+        Ends once the channel is closed and drained. Works whether the listener connects
+        before or after the work starts; reconnecting with last_event_id resumes. If no
+        work is attached and nothing is published for idle_timeout seconds, it ends too.
+        """
+        channel = self._track(channel_id, "listeners", 1)
+        try:
+            after = last_event_id
+            idle_since = time.monotonic()
+            while True:
+                wait = KEEPALIVE_SECONDS
+                if not channel.workers:
+                    wait = min(wait, max(idle_timeout - (time.monotonic() - idle_since), 0))
+                events, closed = channel.read(after, wait)
+                for event in events:
+                    after = event["id"]
+                    yield event
+                if closed:
+                    return
+                if events or channel.workers:
+                    idle_since = time.monotonic()
+                elif time.monotonic() - idle_since >= idle_timeout:
+                    return
+                if not events:
+                    yield None
+        finally:
+            self._track(channel_id, "listeners", -1)
+
+
+bus = ProgressBus()
+
+
+def emit(event, **data):
+    """Publish an event to the current request's progress channel, if it has one."""
+    channel = _current.get()
+    if channel is not None:
+        channel.publish(event, data)
+
+
+def attach(channel_id):
+    """Route emit() calls in this context to a bus channel; returns a token for detach."""
+    return _current.set(bus.open(channel_id))
+
+
+def detach(token, error=None):
+    channel = _current.get()
+    _current.reset(token)
+    if channel is not None:
+        if error is not None:
+            channel.close("error", error=str(error))
+        else:
+            channel.close()
+        bus.done(channel)
+
+
+@contextmanager
+def report_to(channel_id=None, listener=None):
+    """
+    Collect progress for the block on a bus channel (channel_id) or a private channel
+    whose events are passed to listener.
+    """
+    channel = bus.open(channel_id) if channel_id else ProgressChannel(listener=listener)
+    token = _current.set(channel)
+    try:
+        yield channel
+    except BaseException as e:
+        channel.close("error", error=str(e) or type(e).__name__)
+        raise
+    else:
+        channel.close()
+    finally:
+        _current.reset(token)
+        if channel_id:
+            bus.done(channel)
+
+
+def format_sse(event):
+    """Serialize an event (or a keep-alive for None) in text/event-stream format."""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
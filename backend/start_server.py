@@ -1,6 +1,21 @@
+"""
+Serve the Flask app with Waitress.
+
+Waitress answers each request on one of a fixed number of worker threads, and a
+streaming response keeps its thread until the stream ends: every open progress
+listener (/api/progress/<id>), batch stream and export download pins one. The pool
+must therefore be sized for the streams you expect to have open at once plus the
+ordinary requests served alongside them; set WAITRESS_THREADS accordingly.
+"""
+import os
+
 from waitress import serve
-from api import app
+from api import app, routes
+
+# Worker threads: concurrent streams (progress listeners, batch and export streams) plus headroom
+WAITRESS_THREADS = int(os.getenv("WAITRESS_THREADS", "64"))
 
 if __name__ == "__main__":
-    print("🚀 Starting Flask app with Waitress on http://0.0.0.0:8000")
-    serve(app, host="0.0.0.0", port=8000)
+    routes.build_static_index()
+    print(f"🚀 Starting Flask app with Waitress on http://0.0.0.0:8000 ({WAITRESS_THREADS} threads)")
+    serve(app, host="0.0.0.0", port=8000, threads=WAITRESS_THREADS)
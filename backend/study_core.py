@@ -1,42 +1,237 @@
-from openai import OpenAI, OpenAIError, RateLimitError, APIConnectionError, AuthenticationError
-from dotenv import load_dotenv
-from api.storage import get_uploaded_context
+from api.storage import get_uploaded_context_entry
+from api import context_store
+from card_parser import CardParser, iter_cards, parse_choices
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
-from pathlib import Path
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from types import SimpleNamespace
+from tracing import span, traced
+import profiling
+import progress
+import hashlib
+import json
 import os
 import re
+import threading
+import time
+
+# The OpenAI SDK and client are loaded on the first API call, not at import, to keep cold starts fast
+client = None
+_client_lock = threading.Lock()
+
+def get_openai_client():
+    """Return the shared OpenAI client, loading the SDK on first use (.env is loaded by the api package)."""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from openai import OpenAI
+
+                api_key = os.getenv("OPENAI_API_KEY")
+                if not api_key:
+                    print("❌ Missing OPENAI_API_KEY in environment. Check your .env file.")
+                else:
+                    print("✅ Loaded OpenAI API key.")
+                client = OpenAI(api_key=api_key)
+    return client
+
+_generation_stats = ContextVar("generation_stats", default=None)
+_stats_lock = threading.Lock()
+
+@contextmanager
+def track_generation():
+    """
+    Collect model, prompt hash, token usage and latency for every API call made inside the block.
 
-load_dotenv(dotenv_path=Path(__file__).resolve().parent / ".env")
-api_key = os.getenv("OPENAI_API_KEY")
-
-if not api_key:
-    print("❌ Missing OPENAI_API_KEY in environment. Check your .env file.")
-else:
-    print("✅ Loaded OpenAI API key.")
-
-client = OpenAI(api_key=api_key)
+    Yields:
+        dict: Aggregated stats, filled in as calls complete.
+    """
+    stats = {
+        "model": None,
+        "prompt_hash": None,
+        "calls": 0,
+        "latency_ms": 0,
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+    token = _generation_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _generation_stats.reset(token)
+
+def _record_call(model, messages, response, latency):
+    stats = _generation_stats.get()
+    if stats is None:
+        return
+    call_hash = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+    usage = getattr(response, "usage", None)
+    with _stats_lock:
+        stats["model"] = model
+        stats["prompt_hash"] = hashlib.sha256(((stats["prompt_hash"] or "") + call_hash).encode()).hexdigest()[:16]
+        stats["calls"] += 1
+        stats["latency_ms"] += int(latency * 1000)
+        for field in stats["usage"]:
+            stats["usage"][field] += getattr(usage, field, 0) or 0
 
 def make_prompt(role, user_msg):
     return [{"role": "system", "content": role}, {"role": "user", "content": user_msg}]
 
 def call_openai_api(model, messages, max_tokens=500, temperature=0.7):
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-        )
+        with span("openai.chat", model=model, max_tokens=max_tokens) as s:
+            start = time.perf_counter()
+            response = get_openai_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+            _record_call(model, messages, response, time.perf_counter() - start)
+            s["args"]["total_tokens"] = getattr(getattr(response, "usage", None), "total_tokens", None)
         return response.choices[0].message.content
-    except (AuthenticationError, RateLimitError, APIConnectionError, OpenAIError) as e:
-        raise RuntimeError(f"OpenAI API error: {e}")
     except Exception as e:
+        from openai import OpenAIError
+
+        if isinstance(e, OpenAIError):
+            raise RuntimeError(f"OpenAI API error: {e}")
         raise RuntimeError(f"Unexpected error: {e}")
     
+def stream_openai_api(model, messages, max_tokens=500, temperature=0.7):
+    """
+    Like call_openai_api, but yields the completion text in chunks as the model produces it,
+    so callers can parse and show results before the whole response has arrived.
+    """
+    try:
+        with span("openai.chat", model=model, max_tokens=max_tokens, stream=True) as s:
+            start = time.perf_counter()
+            usage = None
+            stream = get_openai_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            for chunk in stream:
+                usage = chunk.usage or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            # Usage arrives with the final chunk; record the call like a non-streamed one
+            _record_call(model, messages, SimpleNamespace(usage=usage), time.perf_counter() - start)
+            s["args"]["total_tokens"] = getattr(usage, "total_tokens", None)
+    except Exception as e:
+        from openai import OpenAIError
+
+        if isinstance(e, OpenAIError):
+            raise RuntimeError(f"OpenAI API error: {e}")
+        raise RuntimeError(f"Unexpected error: {e}")
+
+# Contexts longer than this (in characters) are condensed before being sent in prompts
+CONTEXT_DIGEST_THRESHOLD = int(os.getenv("CONTEXT_DIGEST_THRESHOLD", "12000"))
+CONTEXT_CHUNK_CHARS = int(os.getenv("CONTEXT_CHUNK_CHARS", "8000"))
+CONTEXT_DIGEST_MAX_CHARS = int(os.getenv("CONTEXT_DIGEST_MAX_CHARS", "6000"))
+CONTEXT_DIGEST_WORKERS = int(os.getenv("CONTEXT_DIGEST_WORKERS", "4"))
+
+DIGEST_CACHE_SIZE = 32
+
+_digest_cache = OrderedDict()  # context hash -> digest, least recently used first
+_digest_locks = {}  # Only for contexts being condensed right now
+_digest_locks_guard = threading.Lock()
+
+def split_context(text, chunk_chars=CONTEXT_CHUNK_CHARS):
+    """Split text into chunks of at most chunk_chars, preferring paragraph boundaries."""
+    chunks, current, size = [], [], 0
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) > chunk_chars:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            while len(paragraph) > chunk_chars:
+                chunks.append(paragraph[:chunk_chars])
+                paragraph = paragraph[chunk_chars:]
+        if size + len(paragraph) > chunk_chars and current:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return [c for c in chunks if c.strip()]
+
+def _summarize_chunk(chunk):
+    user_msg = (
+        "Condense the following study notes into a dense summary of the key facts, "
+        "definitions and relationships. Keep terminology exact.\n\n" + chunk
+    )
+    messages = make_prompt("You condense lecture notes for a study assistant.", user_msg)
+    return call_openai_api("gpt-3.5-turbo", messages, max_tokens=400, temperature=0.2)
+
+@traced("study_core.condense_context")
+def condense_context(text, max_chars=CONTEXT_DIGEST_MAX_CHARS):
+    """
+    Map-reduce a long context into a digest of at most max_chars:
+    chunks are summarized concurrently, then the summaries are condensed again until they fit.
+    """
+    level = text
+    while len(level) > max_chars:
+        chunks = split_context(level)
+        if len(chunks) <= 1 and level is not text:
+            break
+        with ThreadPoolExecutor(max_workers=CONTEXT_DIGEST_WORKERS) as executor:
+            # Copy the caller's context per chunk so stats and trace spans follow the work
+            futures = [executor.submit(copy_context().run, profiling.run, _summarize_chunk, c) for c in chunks]
+            summaries = [f.result() for f in futures]
+        condensed = "\n\n".join(s.strip() for s in summaries)
+        if len(condensed) >= len(level):
+            break
+        level = condensed
+    return level[:max_chars]
+
+@traced("study_core.get_prompt_context")
+def get_prompt_context(topic):
+    """
+    Return the context to embed in prompts for a topic. Large contexts are replaced by
+    a condensed digest, cached in memory and on disk by the context's hash.
+    """
+    context, context_hash = get_uploaded_context_entry(topic)
+    if len(context) <= CONTEXT_DIGEST_THRESHOLD:
+        return context
+
+    with _digest_locks_guard:
+        if context_hash in _digest_cache:
+            _digest_cache.move_to_end(context_hash)
+            return _digest_cache[context_hash]
+        lock = _digest_locks.setdefault(context_hash, threading.Lock())
+    # Concurrent generators for the same context wait for a single condensation
+    try:
+        with lock:
+            with _digest_locks_guard:
+                digest = _digest_cache.get(context_hash)
+            if digest is None:
+                digest = context_store.load_digest(context_hash)
+            if digest is None:
+                print(f"🧩 Condensing {len(context)} characters of context...")
+                digest = condense_context(context)
+                context_store.save_digest(context_hash, digest)
+            with _digest_locks_guard:
+                _digest_cache[context_hash] = digest
+                _digest_cache.move_to_end(context_hash)
+                while len(_digest_cache) > DIGEST_CACHE_SIZE:
+                    _digest_cache.popitem(last=False)
+    finally:
+        # Later callers find the digest in the cache or on disk, so the lock is not kept
+        with _digest_locks_guard:
+            if _digest_locks.get(context_hash) is lock:
+                del _digest_locks[context_hash]
+    return digest
+
+@traced("generate.study_content")
 def generate_study_content(topic, output_box, study_data):
     print(f"Generating study content for {topic}...")
     try:
-        context = get_uploaded_context()
+        context = get_prompt_context(topic)
         user_msg = (
             f"Using the following context:\n\n{context}\n\n"
             f"Generate a detailed and beginner-friendly study summary for the topic '{topic}'. "
@@ -50,27 +245,38 @@ def generate_study_content(topic, output_box, study_data):
     except Exception as e:
         output_box.insert("end", f"Error generating study content: {e}")
 
+@traced("generate.flashcards")
 def generate_flashcards(topic, output_box, study_data):
     try:
-        context = get_uploaded_context()
-        existing = study_data.get("flashcards", "")
+        context = get_prompt_context(topic)
+        existing = study_data.get_history_text(topic, "flashcards")
         user_msg = (
             f"Using this context:\n{context}\n\n"
             f"Existing flashcards:\n{existing}\n\n"
             f"Generate 15 new, unique flashcards for '{topic}' in the format:\nQ: ...\nA: ..."
         )
         messages = make_prompt("You are an assistant that creates educational flashcards.", user_msg)
-        flashcards = call_openai_api("gpt-3.5-turbo", messages)
 
-        output_box.insert("end", "Flashcards:\n" + flashcards)
-        study_data["flashcards"] = study_data.get("flashcards", "") + "\n\n" + flashcards
+        # Stream the completion so each card is shown (and reported) as soon as it is written
+        output_box.insert("end", "Flashcards:\n")
+        parser, parts = CardParser(), []
+        for delta in stream_openai_api("gpt-3.5-turbo", messages):
+            parts.append(delta)
+            output_box.insert("end", delta)
+            for card in parser.feed(delta):
+                progress.emit("card", index=parser.count, question=card["question"], answer=card["answer"])
+        for card in parser.close():
+            progress.emit("card", index=parser.count, question=card["question"], answer=card["answer"])
+
+        study_data.append_item(topic, "flashcards", "".join(parts))
     except Exception as e:
         output_box.insert("end", f"Error generating flashcards: {e}")
 
+@traced("generate.quiz")
 def run_quiz(topic, output_box, study_data):
     try:
-        context = get_uploaded_context()
-        existing = study_data.get("quiz", "")
+        context = get_prompt_context(topic)
+        existing = study_data.get_history_text(topic, "quiz")
         user_msg = (
             f"Using this context:\n{context}\n\n"
             f"Previously generated quiz:\n{existing}\n\n"
@@ -80,14 +286,15 @@ def run_quiz(topic, output_box, study_data):
         quiz = call_openai_api("gpt-3.5-turbo", messages, max_tokens=1500)
 
         output_box.insert("end", "Quiz:\n" + quiz)
-        study_data["quiz"] = study_data.get("quiz", "") + "\n\n" + quiz
+        study_data.append_item(topic, "quiz", quiz)
     except Exception as e:
         output_box.insert("end", f"Error generating quiz: {e}")
 
+@traced("generate.test")
 def run_test(topic, output_box, study_data):
     def prompt_mc():
-        context = get_uploaded_context()
-        existing = study_data.get("test", "")
+        context = get_prompt_context(topic)
+        existing = study_data.get_history_text(topic, "test")
         user_msg = (
             f"Using this context:\n{context}\n\n"
             f"Previously generated test:\n{existing}\n\n"
@@ -96,8 +303,8 @@ def run_test(topic, output_box, study_data):
         return call_openai_api("gpt-3.5-turbo", make_prompt("You are a structured test generator.", user_msg), max_tokens=1500)
 
     def prompt_fill():
-        context = get_uploaded_context()
-        existing = study_data.get("test", "")
+        context = get_prompt_context(topic)
+        existing = study_data.get_history_text(topic, "test")
         user_msg = (
             f"Using this context:\n{context}\n\n"
             f"Previously generated test:\n{existing}\n\n"
@@ -107,14 +314,15 @@ def run_test(topic, output_box, study_data):
 
     try:
         with ThreadPoolExecutor() as executor:
-            mc_future = executor.submit(prompt_mc)
-            fill_future = executor.submit(prompt_fill)
+            # Run each prompt in a copy of the caller's context so generation stats are collected
+            mc_future = executor.submit(copy_context().run, profiling.run, prompt_mc)
+            fill_future = executor.submit(copy_context().run, profiling.run, prompt_fill)
             mc_questions = mc_future.result()
             fill_questions = fill_future.result()
 
             output_box.insert("end", f"\nMultiple-Choice Questions:\n{mc_questions}\n")
             output_box.insert("end", f"\nFill-in-the-Blank Questions:\n{fill_questions}\n")
-            study_data["test"] = study_data.get("test", "") + "\n\n" + mc_questions + "\n" + fill_questions
+            study_data.append_item(topic, "test", mc_questions + "\n" + fill_questions)
     except Exception as e:
         output_box.insert("end", f"Error generating test: {e}")
 
@@ -123,8 +331,8 @@ def generate_answers(output_box, study_data):
     output_box.insert("end", "Generating answers for quizzes and tests...\n")
 
     try:
-        quiz_data = study_data.get("quiz", "")
-        test_data = study_data.get("test", "")
+        quiz_data = study_data.get_material_text("quiz")
+        test_data = study_data.get_material_text("test")
 
         if not quiz_data and not test_data:
             raise Exception("No quiz or test data found to generate answers.")
@@ -140,32 +348,38 @@ def generate_answers(output_box, study_data):
             output_box.insert("end", "Generating answers for the quiz.\n")
             quiz_questions = [line.strip() for line in quiz_data.split("\n") if line.strip().startswith("Q")]
             quiz_answers = []
-            for q in quiz_questions:
+            for i, q in enumerate(quiz_questions, start=1):
                 try:
                     a = answer_prompt(q)
                     quiz_answers.append(f"{q}\nAnswer: {a}\n")
+                    progress.emit("answered", section="quiz", index=i, total=len(quiz_questions), question=q, answer=a)
                 except Exception as e:
                     quiz_answers.append(f"{q}\nAnswer: Error - {e}\n")
+                    progress.emit("answered", section="quiz", index=i, total=len(quiz_questions), question=q, error=str(e))
             answers += "Quiz Answers:\n" + "\n".join(quiz_answers) + "\n\n"
 
         if test_data:
             output_box.insert("end", "Generating answers for the test.\n")
             test_questions = [line.strip() for line in test_data.split("\n") if line.strip().startswith("Q")]
             test_answers = []
-            for q in test_questions:
+            for i, q in enumerate(test_questions, start=1):
                 try:
                     a = answer_prompt(q)
                     test_answers.append(f"{q}\nAnswer: {a}\n")
+                    progress.emit("answered", section="test", index=i, total=len(test_questions), question=q, answer=a)
                 except Exception as e:
                     test_answers.append(f"{q}\nAnswer: Error - {e}\n")
+                    progress.emit("answered", section="test", index=i, total=len(test_questions), question=q, error=str(e))
             answers += "Test Answers:\n" + "\n".join(test_answers) + "\n\n"
 
         study_data["answers"] = answers
+        progress.emit("persisted", material="answers")
         output_box.insert("end", f"\nAnswers:\n{answers}")
     except Exception as e:
         output_box.insert("end", f"Error generating answers: {e}")
 
 
+@traced("generate.distractors")
 def generate_batch_mock_answers(cards):
     """
     Generates three multiple-choice distractors for each flashcard using the OpenAI API.
@@ -177,8 +391,6 @@ def generate_batch_mock_answers(cards):
         dict: Mapping of each question to a list containing the correct answer and three distractors.
     """
     try:
-        import re
-
         joined_questions = "\n".join(
             f"Q: {card['question']}\nA: {card['answer']}"
             for card in cards if card.get("answer")
@@ -192,29 +404,16 @@ def generate_batch_mock_answers(cards):
         )
 
         messages = make_prompt("You are an assistant that creates distractors for educational multiple-choice questions.", user_msg)
-        raw = call_openai_api("gpt-3.5-turbo", messages, max_tokens=2000)
+        progress.emit("distractors_started", total=len(cards))
 
         output = {}
-        current_q, current_a, choices = "", "", []
-
-        for line in raw.strip().splitlines():
-            if line.lower().startswith("question:"):
-                if current_q and current_a and choices:
-                    output[current_q.strip()] = [current_a.strip()] + choices[:3]
-                current_q = line.split(":", 1)[1].strip()
-                current_a, choices = "", []
-            elif line.lower().startswith("correct:"):
-                current_a = line.split(":", 1)[1].strip()
-            elif line.strip().startswith("-"):
-                try:
-                    cleaned = re.sub(r"(?i)^incorrect option\s*\d*[:\-\.]?\s*", "", line.strip("- ").strip())
-                except Exception as e:
-                    print(f"⚠️ Regex cleanup failed: {e}")
-                    cleaned = line.strip("- ").strip()
-                choices.append(cleaned)
-
-        if current_q and current_a and choices:
-            output[current_q.strip()] = [current_a.strip()] + choices[:3]
+        with span("distractors.parse"):
+            # Cards are parsed as the response streams in, so progress is reported per card
+            for parsed in iter_cards(stream_openai_api("gpt-3.5-turbo", messages, max_tokens=2000)):
+                if parsed["answer"] and parsed["options"]:
+                    output[parsed["question"]] = [parsed["answer"]] + parsed["options"][:3]
+                    progress.emit("distractors", batch="initial", question=parsed["question"],
+                                  done=len(output), total=len(cards))
 
         # Retry missing
         all_questions = {card['question']: card['answer'] for card in cards if card.get('answer')}
@@ -228,11 +427,11 @@ def generate_batch_mock_answers(cards):
                         f"Generate 3 plausible but incorrect answers.\n"
                         f"Format:\n- Incorrect Option 1\n- Incorrect Option 2\n- Incorrect Option 3"
                     )
-                    retry_response = call_openai_api("gpt-3.5-turbo", make_prompt(
-                        "You generate plausible but incorrect answers for quizzes.", retry_msg), max_tokens=300)
+                    with span("distractors.retry", question=q[:80]):
+                        retry_response = call_openai_api("gpt-3.5-turbo", make_prompt(
+                            "You generate plausible but incorrect answers for quizzes.", retry_msg), max_tokens=300)
 
-                    distractors_raw = re.findall(r"^- (.+)", retry_response, re.MULTILINE)
-                    distractors = [re.sub(r"(?i)^incorrect option\s*\d*[:\-\.]?\s*", "", d.strip()) for d in distractors_raw]
+                    distractors = parse_choices(retry_response)
 
                     if distractors:
                         output[q.strip()] = [a] + distractors[:3]
@@ -243,6 +442,7 @@ def generate_batch_mock_answers(cards):
                 except Exception as e:
                     print(f"❌ Retry failed for '{q}': {e}")
                     output[q.strip()] = [a, "Incorrect guess", "Misconception", "Wrong assumption"]
+                progress.emit("distractors", batch="retry", question=q, done=len(output), total=len(cards))
 
         return output
 
@@ -1,5 +1,116 @@
+import atexit
 import json
 import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_HISTORY_LIMIT = 50  # Items kept per topic and material
+DEFAULT_HISTORY_WINDOW = 5  # Most recent items included in prompt context
+HISTORY_PREFIX = "history:"  # Item log keys: history:<topic>:<material>
+PERSISTENT_LOCATIONS = ("file", "sqlite")
+FLUSH_TICK = 1  # Seconds between checks of the shared background flusher
+_MISSING = object()
+
+
+class _Flusher:
+    """
+    One background thread (and one atexit hook) that flushes every write-behind StudyData
+    with pending mutations once its flush_interval has passed. Only instances with pending
+    writes are held, so an instance nobody references any more is released once flushed.
+    """
+
+    def __init__(self):
+        self._dirty = {}  # id -> StudyData with pending mutations
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def mark(self, study_data):
+        with self._lock:
+            self._dirty[id(study_data)] = study_data
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="study-data-flusher", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush_all)
+
+    def discard(self, study_data):
+        with self._lock:
+            self._dirty.pop(id(study_data), None)
+
+    def flush_all(self):
+        with self._lock:
+            dirty = list(self._dirty.values())
+        for study_data in dirty:
+            study_data.flush()
+
+    def _flush_due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [d for d in self._dirty.values() if now - d._last_flush >= d.flush_interval]
+        for study_data in due:
+            study_data.flush()
+
+    def _run(self):
+        # The due list lives in _flush_due so the thread holds no instance while it sleeps
+        while True:
+            time.sleep(FLUSH_TICK)
+            self._flush_due()
+
+
+_flusher = _Flusher()
+
+
+class ItemLog:
+    """
+    An append-only, capped log of generated items for one topic and material.
+    """
+
+    def __init__(self, items=None, next_id=1, max_items=DEFAULT_HISTORY_LIMIT):
+        """
+        Args:
+            items (list): Existing items, oldest first.
+            next_id (int): The id assigned to the next appended item.
+            max_items (int): Number of items retained; older items are dropped.
+        """
+        self.items = deque(items or [], maxlen=max_items)
+        self.next_id = next_id
+
+    def append(self, text):
+        """
+        Appends an item in O(1), dropping the oldest item when the log is full.
+
+        Args:
+            text (str): The item content.
+
+        Returns:
+            int: The id of the new item.
+        """
+        item_id = self.next_id
+        self.items.append({"id": item_id, "text": text, "created_at": int(time.time())})
+        self.next_id += 1
+        return item_id
+
+    def window(self, limit=None):
+        """
+        Returns the most recent items, oldest first.
+
+        Args:
+            limit (int): Maximum number of items to return (default all retained items).
+        """
+        if limit is None or limit >= len(self.items):
+            return list(self.items)
+        return list(self.items)[-limit:]
+
+    def to_dict(self):
+        return {"next_id": self.next_id, "items": list(self.items)}
+
+    @classmethod
+    def from_dict(cls, data, max_items=DEFAULT_HISTORY_LIMIT):
+        data = data or {}
+        return cls(data.get("items"), data.get("next_id", 1), max_items)
+
 
 class StudyData:
     """
@@ -11,12 +122,48 @@ class StudyData:
         Initializes the StudyData object.
 
         Args:
-            config (dict): Configuration for storage options (e.g., file or database).
+            config (dict): Configuration for storage options.
+                storage_location (str): "memory", "file" or "sqlite".
+                File storage also accepts:
+                    location_path (str): JSON file to store the data in (default data/study_data.json).
+                    fsync (bool): fsync the file before it replaces the previous one.
+                SQLite storage also accepts:
+                    db_path (str): Database file (default data/study_data.db).
+                File and SQLite storage accept:
+                    card_name (str): Namespace the keys are stored under (default "study_data").
+                    write_behind (bool): Buffer mutations in memory and flush them in batches.
+                    flush_interval (float): Seconds between background flushes (default 5).
+                    flush_threshold (int): Pending mutations that trigger a flush (default 20).
+                Any storage location accepts:
+                    history_limit (int): Items kept per topic and material (default 50).
+                    history_window (int): Recent items used as prompt context (default 5).
         """
         self.data = {}
         self.config = config or {"storage_location": "memory"}  # Default to in-memory storage
-        self.card_name = "study_data"  # Default card name for file storage
-        self.location_path = os.path.join(os.getcwd(), "data/study_data.json")  # Default file path
+        self.card_name = self.config.get("card_name", "study_data")  # Default card name for file storage
+        self.location_path = self.config.get(
+            "location_path", os.path.join(os.getcwd(), "data/study_data.json")
+        )  # Default file path
+        self.db_path = self.config.get("db_path", os.path.join(os.getcwd(), "data/study_data.db"))
+        self._db = None
+
+        self.history_limit = int(self.config.get("history_limit", DEFAULT_HISTORY_LIMIT))
+        self.history_window = int(self.config.get("history_window", DEFAULT_HISTORY_WINDOW))
+        self._logs = {}
+
+        self.write_behind = bool(self.config.get("write_behind", False))
+        self.flush_interval = float(self.config.get("flush_interval", 5))
+        self.flush_threshold = int(self.config.get("flush_threshold", 20))
+        self.fsync = bool(self.config.get("fsync", False))
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._pending_count = 0
+        self._last_flush = time.monotonic()
+        self._batch = None
+        self._undo = None
+
+        if self.config["storage_location"] == "sqlite":
+            self._connect_db()
 
     def __getitem__(self, key):
         """
@@ -48,9 +195,90 @@ class StudyData:
             key (str): The key to set.
             value: The value to associate with the key.
         """
-        self.data[key] = value
-        if self.config["storage_location"] == "file":
+        with self._lock:
+            if self._batch is not None:
+                self._undo.setdefault(key, self.data.get(key, _MISSING))
+                self.data[key] = value
+                self._batch[key] = value
+                return
+            self.data[key] = value
+            self._persist({key: value})
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups several assignments into one persisted write. If the block raises,
+        the in-memory values are restored and nothing is written.
+        """
+        with self._lock:
+            if self._batch is not None:  # Nested transactions join the outer one
+                yield self
+                return
+            self._batch, self._undo = {}, {}
+            try:
+                yield self
+            except Exception:
+                for key, old in self._undo.items():
+                    if old is _MISSING:
+                        self.data.pop(key, None)
+                    else:
+                        self.data[key] = old
+                    self._logs.pop(key, None)
+                raise
+            finally:
+                batch, self._batch, self._undo = self._batch, None, None
+            if batch:
+                self._persist(batch)
+
+    def _persist(self, values):
+        location = self.config["storage_location"]
+        if location not in PERSISTENT_LOCATIONS:
+            return
+        if self.write_behind:
+            self._pending.update(values)
+            self._pending_count += len(values)
+            _flusher.mark(self)
+            if (self._pending_count >= self.flush_threshold
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self.flush()
+        elif location == "file" and len(values) == 1:
+            key, value = next(iter(values.items()))
             self.store_key_value_in_file(self.card_name, self.location_path, key, value)
+        else:
+            try:
+                self._write_values(values)
+                print(f"✅ Successfully stored {len(values)} key(s) for {self.card_name}")
+            except Exception as e:
+                print(f"❌ Failed to store {len(values)} key(s) for {self.card_name}: {e}")
+
+    def flush(self):
+        """
+        Writes all pending write-behind mutations in a single atomic replace or transaction.
+        """
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._pending:
+                return
+            pending, self._pending, self._pending_count = self._pending, {}, 0
+            try:
+                self._write_values(pending)
+                if not self._pending:
+                    _flusher.discard(self)
+                print(f"✅ Flushed {len(pending)} key(s) for {self.card_name}")
+            except Exception as e:
+                # Keep the values queued so the next flush retries them
+                self._pending = {**pending, **self._pending}
+                print(f"❌ Failed to flush {len(pending)} key(s) for {self.card_name}: {e}")
+
+    def close(self):
+        """
+        Writes any pending mutations and closes the database.
+        """
+        self.flush()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
 
     def store_key_value_in_file(self, card_name, file_path, key, value):
         """
@@ -63,23 +291,84 @@ class StudyData:
             value: The value to store.
         """
         try:
-            if os.path.exists(file_path):
-                with open(file_path, "r") as file:
-                    data = json.load(file)
-            else:
-                data = {}
+            self._write_values_to_file(card_name, file_path, {key: value})
+            print(f"✅ Successfully stored {key} ({_describe(value)}) in {file_path}")
+        except Exception as e:
+            print(f"❌ Failed to store {key} in {file_path}: {e}")
+
+    def _write_values(self, values):
+        if self.config["storage_location"] == "sqlite":
+            self._write_values_to_db(values)
+        else:
+            self._write_values_to_file(self.card_name, self.location_path, values)
 
-            if card_name not in data:
-                data[card_name] = {}
+    def _write_values_to_file(self, card_name, file_path, values):
+        """
+        Merges values into the card section of a JSON file, replacing the file atomically.
 
-            data[card_name][key] = value
+        Args:
+            card_name (str): The name of the card or section.
+            file_path (str): The path to the file.
+            values (dict): The key-value pairs to store.
+        """
+        if os.path.exists(file_path):
+            with open(file_path, "r") as file:
+                data = json.load(file)
+        else:
+            data = {}
 
-            with open(file_path, "w") as file:
-                json.dump(data, file, indent=2)
+        data.setdefault(card_name, {}).update(values)
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(data, file, separators=(",", ":"))
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(tmp_path, file_path)
+
+    def _connect_db(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS study_data ("
+            "card_name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (card_name, key))"
+        )
+        self._db.commit()
+
+    def _write_values_to_db(self, values):
+        """
+        Upserts key-value pairs into the study_data table in one transaction.
+
+        Args:
+            values (dict): The key-value pairs to store.
+        """
+        now = time.time()
+        rows = [(self.card_name, key, json.dumps(value, separators=(",", ":")), now) for key, value in values.items()]
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO study_data (card_name, key, value, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (card_name, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                rows,
+            )
 
-            print(f"✅ Successfully stored {key}: {value} in {file_path}")
+    def load_from_db(self):
+        """
+        Loads this card's study data from the SQLite database.
+        """
+        try:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT key, value FROM study_data WHERE card_name = ?", (self.card_name,)
+                ).fetchall()
+                self.data = {key: json.loads(value) for key, value in rows}
+                self._logs = {}
+            print(f"✅ Successfully loaded {len(rows)} key(s) for {self.card_name} from {self.db_path}")
         except Exception as e:
-            print(f"❌ Failed to store {key}: {value} in {file_path}: {e}")
+            print(f"❌ Failed to load study data from {self.db_path}: {e}")
 
     def load_from_file(self, file_path):
         """
@@ -92,20 +381,142 @@ class StudyData:
             if os.path.exists(file_path):
                 with open(file_path, "r") as file:
                     self.data = json.load(file).get(self.card_name, {})
+                self._logs = {}
                 print(f"✅ Successfully loaded study data from {file_path}")
             else:
                 print(f"⚠️ File {file_path} does not exist. Starting with empty data.")
         except Exception as e:
             print(f"❌ Failed to load study data from {file_path}: {e}")
 
+    def append_item(self, topic, material, text):
+        """
+        Appends a generated item to the topic's history for a material.
+        The material key itself is set to the latest item for readers that expect plain text.
+
+        Args:
+            topic (str): The topic the item was generated for.
+            material (str): e.g. "flashcards", "quiz" or "test".
+            text (str): The generated content.
+
+        Returns:
+            int: The id of the new item.
+        """
+        with self.transaction():
+            log = self.get_item_log(topic, material)
+            item_id = log.append(text)
+            self.set_study_data(_history_key(topic, material), log.to_dict())
+            self.set_study_data(material, text)
+            return item_id
+
+    def get_item_log(self, topic, material):
+        """
+        Returns the ItemLog for a topic and material, creating it if needed.
+        """
+        return self._log_for_key(_history_key(topic, material))
+
+    def _log_for_key(self, key):
+        log = self._logs.get(key)
+        if log is None:
+            log = ItemLog.from_dict(self.data.get(key), self.history_limit)
+            self._logs[key] = log
+        return log
+
+    def get_history_text(self, topic, material, limit=None):
+        """
+        Returns the most recent items for a topic and material joined into prompt context.
+
+        Args:
+            topic (str): The topic.
+            material (str): The material type.
+            limit (int): Number of items to include (default history_window).
+        """
+        items = self.get_item_log(topic, material).window(limit or self.history_window)
+        return "\n\n".join(item["text"] for item in items)
+
+    def get_material_text(self, material, topic=None):
+        """
+        Returns every retained round of a material joined together, as the material key
+        held before rounds were kept in item logs. Keys without a history (such as
+        "content" or "answers") return their stored value.
+
+        Args:
+            material (str): The material type or key.
+            topic (str): Only include this topic's rounds (default all topics, oldest first).
+        """
+        if topic is not None:
+            keys = [_history_key(topic, material)]
+        else:
+            keys = [key for key in self.data if key.startswith(HISTORY_PREFIX) and key.endswith(f":{material}")]
+        items = [item for key in keys if key in self.data for item in self._log_for_key(key).window()]
+        if not items:
+            return self.data.get(material, "")
+        items.sort(key=lambda item: item["created_at"])
+        return "\n\n".join(item["text"] for item in items)
+
+    def memory_usage(self):
+        """
+        Approximates the memory held by the study data.
+
+        Returns:
+            int: Approximate size in bytes of all keys and values.
+        """
+        return sum(len(key) + _approx_size(value) for key, value in self.data.items())
+
     def get(self, key, default=None):
         return self.data.get(key, default)
 
-    def get_all_data(self):
+    def get_all_data(self, limit=None, after=None):
         """
-        Retrieves all stored study data.
+        Retrieves stored study data, optionally one page at a time in key order.
+        Item log keys (history:<topic>:<material>) are left out; read them through
+        get_item_log or get_material_text.
+
+        Args:
+            limit (int): Maximum number of keys to return (default all).
+            after (str): Only return keys sorting after this one; pass the last key
+                of the previous page to continue.
 
         Returns:
-            dict: The entire study data dictionary.
+            dict: The requested key-value pairs (the whole dictionary when no paging is requested).
         """
-        return self.data
\ No newline at end of file
+        if limit is None and after is None:
+            return {key: value for key, value in self.data.items() if not key.startswith(HISTORY_PREFIX)}
+
+        if self.config["storage_location"] == "sqlite":
+            self.flush()
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT key, value FROM study_data WHERE card_name = ? AND key > ? AND key NOT LIKE ? "
+                    "ORDER BY key LIMIT ?",
+                    (self.card_name, after or "", HISTORY_PREFIX + "%", -1 if limit is None else limit),
+                ).fetchall()
+            return {key: json.loads(value) for key, value in rows}
+
+        keys = sorted(key for key in self.data
+                      if (after is None or key > after) and not key.startswith(HISTORY_PREFIX))
+        if limit is not None:
+            keys = keys[:limit]
+        return {key: self.data[key] for key in keys}
+
+def _history_key(topic, material):
+    return f"{HISTORY_PREFIX}{topic.strip().lower()}:{material}"
+
+
+def _describe(value):
+    """Short description of a stored value so log lines stay bounded in size."""
+    if isinstance(value, str):
+        return f"{len(value)} chars"
+    if isinstance(value, (list, dict)):
+        return f"{len(value)} items"
+    return type(value).__name__
+
+
+def _approx_size(value):
+    """Rough byte size of a JSON-like value, used for memory caps."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(str(k)) + _approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_approx_size(v) for v in value)
+    return 8
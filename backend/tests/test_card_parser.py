@@ -0,0 +1,86 @@
+from card_parser import CardParser, clean_option, iter_cards, parse_cards, parse_choices
+
+
+def test_q_and_a_lines():
+    cards = parse_cards("Q: What is DNA?\nA: A nucleic acid.\n\nQ: What is RNA?\nA: Another one.\n")
+    assert cards == [
+        {"question": "What is DNA?", "answer": "A nucleic acid.", "options": []},
+        {"question": "What is RNA?", "answer": "Another one.", "options": []},
+    ]
+
+
+def test_question_and_answer_labels():
+    cards = parse_cards("Question: Largest planet?\nAnswer: Jupiter\n")
+    assert cards == [{"question": "Largest planet?", "answer": "Jupiter", "options": []}]
+
+
+def test_numbered_q_and_a_labels():
+    cards = parse_cards("Q1: First?\nA1: one\nQ 2: Second?\nA 2: two\n")
+    assert [(c["question"], c["answer"]) for c in cards] == [("First?", "one"), ("Second?", "two")]
+
+
+def test_numbered_questions():
+    cards = parse_cards("1. What is 2 + 2?\nA: 4\n2) What is 3 + 3?\nA: 6\n")
+    assert [(c["question"], c["answer"]) for c in cards] == [("What is 2 + 2?", "4"), ("What is 3 + 3?", "6")]
+
+
+def test_numbered_lines_after_an_answer_continue_it():
+    cards = parse_cards("Q: Name the steps.\nA: In order:\n1. Prophase\n2. Metaphase\n\nQ: Next?\nA: Yes\n")
+    assert cards[0]["answer"] == "In order:\n1. Prophase\n2. Metaphase"
+    assert cards[1]["question"] == "Next?"
+
+
+def test_lettered_options_with_answer_letter():
+    cards = parse_cards("1. Capital of France?\nA. Berlin\nB) Paris\nc. Rome\nAnswer: B\n")
+    assert cards == [{"question": "Capital of France?", "answer": "Paris", "options": ["Berlin", "Paris", "Rome"]}]
+
+
+def test_abbreviations_are_not_options():
+    cards = parse_cards("Q: Name an organelle.\nA: One that makes ATP,\ne. g. mitochondria\n")
+    assert cards == [{"question": "Name an organelle.", "answer": "One that makes ATP, e. g. mitochondria",
+                      "options": []}]
+    cards = parse_cards("1. Which is an organelle?\nA. Ribosome\nb) Nucleus\nE. g. both\n")
+    assert cards[0]["options"] == ["Ribosome", "Nucleus"]
+
+
+def test_bulleted_options_with_check_mark():
+    cards = parse_cards("Q: Which is a mammal?\n- Shark\n* Whale ✔\n• Trout\n")
+    assert cards == [{"question": "Which is a mammal?", "answer": "Whale", "options": ["Shark", "Whale", "Trout"]}]
+
+
+def test_distractor_format():
+    text = "Question: Boiling point of water?\nCorrect: 100 °C\n\nChoices:\n- Distractor 1: 90 °C\n- 80 °C\n"
+    cards = parse_cards(text)
+    assert cards == [{"question": "Boiling point of water?", "answer": "100 °C", "options": ["90 °C", "80 °C"]}]
+
+
+def test_mixed_formats():
+    text = "Q: Plain?\nA: yes\n\n2. Choice?\nA. x\nB. y ✔\n"
+    cards = parse_cards(text)
+    assert [(c["question"], c["answer"]) for c in cards] == [("Plain?", "yes"), ("Choice?", "y")]
+
+
+def test_wrapped_question_and_markdown():
+    cards = parse_cards("## **Q: What does a mitochondrion**\ndo in a cell?\n**A:** It makes ATP.\n")
+    assert cards == [{"question": "What does a mitochondrion do in a cell?", "answer": "It makes ATP.", "options": []}]
+
+
+def test_cards_are_returned_as_soon_as_complete():
+    parser = CardParser()
+    assert parser.feed("Q: One?\nA: 1\n") == []
+    done = parser.feed("\nQ: Tw")
+    assert [c["question"] for c in done] == ["One?"]
+    assert parser.feed("o?\nA: 2") == []
+    assert [c["answer"] for c in parser.close()] == ["2"]
+    assert parser.count == 2
+
+
+def test_chunk_boundaries_do_not_change_the_result():
+    text = "Q: Alpha?\nA: a\n\n1. Beta?\nA. b1\nB. b2\nAnswer: A\n"
+    chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+    assert list(iter_cards(chunks)) == parse_cards(text)
+
+
+def test_parse_choices_and_clean_option():
+    assert parse_choices("Here you go:\n- Incorrect Option 1 - Lyon\nB) Nice ✔\nnot an option\n") == ["Lyon", "Nice"]
+    assert clean_option("**Distractor 2:** Marseille") == "Marseille"
@@ -0,0 +1,184 @@
+"""
+Lightweight span tracing for API requests.
+
+A trace is started per request and carried in a ContextVar, so spans opened anywhere
+underneath (generators, OpenAI calls, parsing, storage) attach to it, including work
+submitted to thread pools with copy_context().run. Outside a trace, span() is a no-op.
+
+Finished traces are kept in a small ring buffer and can be exported as Chrome
+trace-event JSON (load in chrome://tracing or https://ui.perfetto.dev). The
+/api/debug/traces endpoint that serves them is off unless profiling is switched on,
+and needs PROFILING_TOKEN (as X-Debug-Token) when one is set.
+"""
+import functools
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+MAX_TRACES = int(os.getenv("TRACING_MAX_TRACES", "200"))
+
+_current = ContextVar("trace", default=None)
+_finished = deque(maxlen=MAX_TRACES)
+_finished_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, name, request_id=None):
+        self.name = name
+        self.request_id = request_id or uuid.uuid4().hex
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "spans": len(self.spans),
+        }
+
+
+def current_trace():
+    return _current.get()
+
+
+def current_request_id():
+    trace = _current.get()
+    return trace.request_id if trace else None
+
+
+@contextmanager
+def start_trace(name, request_id=None):
+    """
+    Trace everything inside the block as one request. The root span covers the whole block.
+
+    Yields:
+        Trace, or None when tracing is disabled.
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+    trace = Trace(name, request_id)
+    token = _current.set(trace)
+    try:
+        with span(name):
+            yield trace
+    finally:
+        _current.reset(token)
+        finish_trace(trace)
+
+
+def begin_trace(name, request_id=None):
+    """
+    Start a trace without a with-block, for frameworks that split setup and teardown
+    into separate hooks. Returns (trace, token) for end_trace, or (None, None) if disabled.
+    """
+    if not TRACING_ENABLED:
+        return None, None
+    trace = Trace(name, request_id)
+    return trace, _current.set(trace)
+
+
+def end_trace(trace, token, **args):
+    if trace is None:
+        return
+    _current.reset(token)
+    elapsed = time.perf_counter() - trace.start
+    trace.add({"name": trace.name, "ts": 0, "dur": elapsed, "tid": threading.get_ident(), "args": args})
+    finish_trace(trace)
+
+
+def finish_trace(trace):
+    trace.duration_ms = round((time.perf_counter() - trace.start) * 1000, 2)
+    with _finished_lock:
+        _finished.append(trace)
+
+
+@contextmanager
+def span(name, **args):
+    """
+    Time the block as a span of the current trace. Extra details can be added to the
+    yielded dict's "args" while the block runs.
+    """
+    trace = _current.get()
+    if trace is None:
+        yield {"args": args}
+        return
+    record = {"name": name, "args": args, "tid": threading.get_ident()}
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["args"]["error"] = repr(e)
+        raise
+    finally:
+        record["ts"] = start - trace.start
+        record["dur"] = time.perf_counter() - start
+        trace.add(record)
+
+
+def traced(name=None):
+    """Decorator that wraps every call to the function in a span."""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def recent_traces(limit=20, min_ms=0, request_id=None):
+    """Most recent finished traces first, optionally filtered by duration or request id."""
+    with _finished_lock:
+        traces = list(_finished)
+    traces = [
+        t for t in reversed(traces)
+        if t.duration_ms >= min_ms and (request_id is None or t.request_id == request_id)
+    ]
+    return traces[:limit]
+
+
+def to_chrome_trace(traces):
+    """
+    Convert traces to Chrome trace-event JSON. Each trace is shown as its own process,
+    with one row per thread that did work for it.
+    """
+    events = []
+    for pid, trace in enumerate(traces, start=1):
+        base_us = trace.started_at * 1e6
+        events.append({
+            "name": "process_name", "ph": "M", "pid": pid,
+            "args": {"name": f"{trace.name} [{trace.request_id}]"},
+        })
+        with trace._lock:
+            spans = list(trace.spans)
+        for record in spans:
+            events.append({
+                "name": record["name"],
+                "ph": "X",
+                "pid": pid,
+                "tid": record["tid"],
+                "ts": round(base_us + record["ts"] * 1e6, 1),
+                "dur": round(record["dur"] * 1e6, 1),
+                "args": {k: v if isinstance(v, (int, float, bool, type(None))) else str(v)
+                         for k, v in record["args"].items()},
+            })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
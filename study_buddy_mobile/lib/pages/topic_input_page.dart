@@ -8,6 +8,7 @@ import 'package:shared_preferences/shared_preferences.dart';
 import 'package:study_buddy_mobile/pages/flashcard_page.dart';
 import 'package:study_buddy_mobile/pages/quiz_test_viewer_page.dart';
 import 'package:study_buddy_mobile/services/api_service.dart';
+import 'package:study_buddy_mobile/services/study_pack_store.dart';
 
 class TopicInputPage extends StatefulWidget {
   final void Function() toggleTheme;
@@ -111,8 +112,11 @@ void _generateFlashcards() async {
   );
 
   try {
-    final cards = await ApiService.fetchFlashcards(_controller.text);
-    final casted = List<Map<String, dynamic>>.from(cards);
+    // Saved or synced study pack first; only generate when the topic has no cards yet
+    final topic = _controller.text;
+    final saved = StudyPackStore.cards(await StudyPackStore.refresh(topic));
+    final casted = saved ?? List<Map<String, dynamic>>.from(await ApiService.fetchFlashcards(topic));
+    if (saved == null && casted.isNotEmpty) await StudyPackStore.refresh(topic);
     final asText = casted.map((card) => "Q: ${card['question']}\nA: ${card['answer']}").join("\n\n");
 
     setState(() {
@@ -187,7 +191,10 @@ void _generateFlashcards() async {
   );
 
   try {
-    final quiz = await ApiService.fetchQuiz(_controller.text);
+    final topic = _controller.text;
+    final saved = StudyPackStore.text(await StudyPackStore.refresh(topic), 'quiz');
+    final quiz = saved ?? await ApiService.fetchQuiz(topic);
+    if (saved == null) await StudyPackStore.refresh(topic);
     setState(() {
       _quizContent = quiz;
       _isLoading = false;
@@ -228,7 +235,10 @@ void _generateFlashcards() async {
   );
 
   try {
-    final test = await ApiService.fetchTest(_controller.text);
+    final topic = _controller.text;
+    final saved = StudyPackStore.text(await StudyPackStore.refresh(topic), 'test');
+    final test = saved ?? await ApiService.fetchTest(topic);
+    if (saved == null) await StudyPackStore.refresh(topic);
     setState(() {
       _testContent = test;
       _isLoading = false;
@@ -3,11 +3,44 @@ import 'package:http/http.dart' as http;
 import '../utils/api_base.dart';
 
 class ApiService {
-  static Future<List<dynamic>> fetchFlashcards(String topic) async {
-    final uri = ApiBase.endpoint("/flashcards?force=true");
+  static Map<String, String> _headers(String? progressId) => {
+        'Content-Type': 'application/json',
+        if (progressId != null) 'X-Progress-Id': progressId,
+      };
+
+  /// Step events ("started", "persisted", "distractors_started", ...) for a request sent with the same progressId.
+  /// The stream ends when the request finishes, or after a short wait if no request uses the id.
+  static Stream<Map<String, dynamic>> progressEvents(String progressId) async* {
+    final client = http.Client();
+    try {
+      final request = http.Request('GET', ApiBase.endpoint("/progress/$progressId"));
+      request.headers['Accept'] = 'text/event-stream';
+      final response = await client.send(request);
+      String event = 'message';
+      final data = <String>[];
+      await for (final line in response.stream.transform(utf8.decoder).transform(const LineSplitter())) {
+        if (line.isEmpty) {
+          if (data.isNotEmpty) {
+            yield {'event': event, 'data': jsonDecode(data.join('\n'))};
+          }
+          event = 'message';
+          data.clear();
+        } else if (line.startsWith('event:')) {
+          event = line.substring(6).trim();
+        } else if (line.startsWith('data:')) {
+          data.add(line.substring(5).trim());
+        }
+      }
+    } finally {
+      client.close();
+    }
+  }
+
+  static Future<List<dynamic>> fetchFlashcards(String topic, {bool force = false, String? progressId}) async {
+    final uri = ApiBase.endpoint(force ? "/flashcards?force=true" : "/flashcards");
     final response = await http.post(
       uri,
-      headers: {'Content-Type': 'application/json'},
+      headers: _headers(progressId),
       body: jsonEncode({'topic': topic}),
     );
     if (response.statusCode == 200) {
@@ -31,11 +64,11 @@ class ApiService {
     }
   }
 
-  static Future<String> fetchQuiz(String topic) async {
-    final uri = ApiBase.endpoint("/quiz?force=true");
+  static Future<String> fetchQuiz(String topic, {bool force = false, String? progressId}) async {
+    final uri = ApiBase.endpoint(force ? "/quiz?force=true" : "/quiz");
     final response = await http.post(
       uri,
-      headers: {'Content-Type': 'application/json'},
+      headers: _headers(progressId),
       body: jsonEncode({'topic': topic}),
     );
     if (response.statusCode == 200) {
@@ -45,11 +78,11 @@ class ApiService {
     }
   }
 
-  static Future<String> fetchTest(String topic) async {
-    final uri = ApiBase.endpoint("/test?force=true");
+  static Future<String> fetchTest(String topic, {bool force = false, String? progressId}) async {
+    final uri = ApiBase.endpoint(force ? "/test?force=true" : "/test");
     final response = await http.post(
       uri,
-      headers: {'Content-Type': 'application/json'},
+      headers: _headers(progressId),
       body: jsonEncode({'topic': topic}),
     );
     if (response.statusCode == 200) {
@@ -59,6 +92,48 @@ class ApiService {
     }
   }
 
+  /// One page of parsed items ("quiz", "test" or "flashcards"): {items, total, next_cursor}.
+  /// Pass the previous page's next_cursor to continue; a 410 means the material changed.
+  static Future<Map<String, dynamic>?> fetchItems(String topic, String material,
+      {String? cursor, int limit = 20}) async {
+    final query = Uri(queryParameters: {
+      'topic': topic,
+      'limit': '$limit',
+      if (cursor != null) 'cursor': cursor,
+    }).query;
+    final response = await http.get(ApiBase.endpoint("/$material?$query"));
+    if (response.statusCode == 200) {
+      return jsonDecode(response.body);
+    } else {
+      return null;
+    }
+  }
+
+  /// Every stored material for a topic plus its version vector, as one gzipped download.
+  static Future<Map<String, dynamic>?> fetchStudyPack(String topic) async {
+    final query = Uri(queryParameters: {'topic': topic}).query;
+    final response = await http.get(ApiBase.endpoint("/study_pack?$query"));
+    if (response.statusCode == 200) {
+      return jsonDecode(response.body);
+    } else {
+      return null;
+    }
+  }
+
+  /// Only the materials and items that changed since [versions] (material -> etag).
+  static Future<Map<String, dynamic>?> syncStudyPack(String topic, Map<String, dynamic> versions) async {
+    final response = await http.post(
+      ApiBase.endpoint("/sync"),
+      headers: {'Content-Type': 'application/json'},
+      body: jsonEncode({'topic': topic, 'versions': versions}),
+    );
+    if (response.statusCode == 200) {
+      return jsonDecode(response.body);
+    } else {
+      return null;
+    }
+  }
+
   static Future<void> sendTopicToAPI(String topic) async {
     final uri = ApiBase.endpoint("/add_topic");
     await http.post(
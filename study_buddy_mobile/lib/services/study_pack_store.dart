@@ -0,0 +1,102 @@
+import 'dart:convert';
+import 'package:shared_preferences/shared_preferences.dart';
+import 'api_service.dart';
+
+/// Offline study packs: the first visit to a topic downloads the whole pack, later
+/// visits only ask the server what changed since the saved version vector.
+///
+/// Quiz, test and flashcard sections may be updated item by item, in which case their
+/// raw `content` is dropped; render those from `items` (see [cards] and [text]).
+class StudyPackStore {
+  static String _key(String topic) => 'studyPack:${topic.toLowerCase()}';
+
+  static Future<Map<String, dynamic>?> load(String topic) async {
+    final prefs = await SharedPreferences.getInstance();
+    final saved = prefs.getString(_key(topic));
+    return saved == null ? null : jsonDecode(saved);
+  }
+
+  static Future<void> _save(String topic, Map<String, dynamic> pack) async {
+    final prefs = await SharedPreferences.getInstance();
+    await prefs.setString(_key(topic), jsonEncode(pack));
+  }
+
+  /// The up-to-date pack for a topic, or the saved one when the server is unreachable.
+  static Future<Map<String, dynamic>?> refresh(String topic) async {
+    final saved = await load(topic);
+    try {
+      if (saved == null) {
+        final pack = await ApiService.fetchStudyPack(topic);
+        if (pack != null) await _save(topic, pack);
+        return pack;
+      }
+      // Flashcards saved before their items were built are asked for again in full
+      final versions = Map<String, dynamic>.from(saved['versions'])
+        ..removeWhere((material, _) => material == 'flashcards' && cards(saved) == null);
+      final delta = await ApiService.syncStudyPack(topic, versions);
+      if (delta == null) return saved;
+      final updated = apply(saved, delta);
+      await _save(topic, updated);
+      return updated;
+    } catch (e) {
+      return saved;
+    }
+  }
+
+  /// Flashcards ({question, answer, options}) of a pack, or null if it has none yet.
+  /// The server leaves out flashcard items until they were built by a /flashcards request.
+  static List<Map<String, dynamic>>? cards(Map<String, dynamic>? pack) {
+    final items = pack?['materials']?['flashcards']?['items'];
+    if (items == null || items.isEmpty) return null;
+    return List<Map<String, dynamic>>.from(items);
+  }
+
+  /// A quiz or test as text, rebuilt from its items when the raw content was dropped.
+  static String? text(Map<String, dynamic>? pack, String material) {
+    final section = pack?['materials']?[material];
+    if (section == null) return null;
+    if (section['content'] != null) return section['content'];
+    final lines = <String>[];
+    String? heading;
+    for (final item in section['items'] ?? []) {
+      if (item['section'] != null && item['section'] != heading) {
+        heading = item['section'];
+        lines.add('\n$heading');
+      }
+      lines.add('${item['id']}. ${item['question']}');
+      for (final option in item['options'] ?? []) {
+        lines.add('${option['key']}. ${option['text']}');
+      }
+      if (item['answer'] != null) lines.add('Answer: ${item['answer']}');
+      lines.add('');
+    }
+    return lines.join('\n').trim();
+  }
+
+  /// Merge a /sync response into a saved pack.
+  static Map<String, dynamic> apply(Map<String, dynamic> pack, Map<String, dynamic> delta) {
+    final materials = Map<String, dynamic>.from(pack['materials']);
+    for (final material in delta['removed']) {
+      materials.remove(material);
+    }
+    Map<String, dynamic>.from(delta['changed']).forEach((material, section) {
+      if (!section.containsKey('order')) {
+        materials[material] = section;
+        return;
+      }
+      final byKey = {
+        for (final item in materials[material]?['items'] ?? []) item['key']: item,
+        for (final item in section['upserts']) item['key']: item,
+      };
+      materials[material] = {
+        'etag': section['etag'],
+        'content': null,
+        'items': [
+          for (final (index, key) in List<String>.from(section['order']).where(byKey.containsKey).indexed)
+            {...byKey[key], 'id': index + 1},
+        ],
+      };
+    });
+    return {'topic': pack['topic'], 'versions': delta['versions'], 'materials': materials};
+  }
+}
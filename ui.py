@@ -9,10 +9,14 @@ from api.storage import upload_context_file, save_study_data_to_file  # API stor
 from PIL import Image  # For handling images
 import sys  # System-specific parameters and functions
 from pathlib import Path  # For file path manipulations
-import requests  # For making HTTP requests
+from api.client import get_client  # Pooled HTTP client for the Study Buddy API
 import json  # For JSON serialization and deserialization
 import random  # For randomization
+import queue  # For handing background results to the UI thread
+import threading  # For loading from the server without blocking the UI
+import uuid  # For progress channel ids
 from study_data import StudyData  # Import the Study class for managing study data
+from card_parser import parse_cards  # Incremental parser shared with the server
 
 # Initialize the StudyData object
 study_data = StudyData(config={"storage_location": "file"})  # Use file storage for persistence
@@ -260,7 +264,8 @@ def setup_ui(root):
         Updates the study data display box with the current study data.
         """
         study_data_box.delete("1.0", "end")
-        for key, value in study_data.get_all_data().items():
+        for key in study_data.get_all_data():
+            value = study_data.get_material_text(key)
             study_data_box.insert("end", f"{key.capitalize()}:\n{value if value else 'No data'}\n\n")
 
     # Create the button frame for generating study materials
@@ -372,11 +377,8 @@ def send_topic_to_api(topic):
         topic: The topic string to send to the API.
     """
     try:
-        res = requests.post("http://127.0.0.1:5000/api/add_topic", json={"topic": topic}, timeout=5)
-        if res.status_code == 200:
-            print("✅ Sent to API:", topic)
-        else:
-            print("❌ API Error:", res.json())
+        get_client().post_json("add_topic", {"topic": topic})
+        print("✅ Sent to API:", topic)
     except Exception as e:
         show_server_connection_error("add_topic", e)
 
@@ -388,13 +390,10 @@ def get_topics_from_api():
         A list of topics or an error message if the API call fails.
     """
     try:
-        res = requests.get("http://127.0.0.1:5000/api/get_topics", timeout=5)
-        if res.status_code == 200:
-            return res.json().get("topics", [])
-        else:
-            return ["Error fetching topics"]
+        return get_client().get_json("get_topics").get("topics", [])
     except Exception as e:
         show_server_connection_error("get_topics", e)
+        return ["Error fetching topics"]
     
 def prompt_server_load(entry, output_box):
     topic = entry.get().strip()
@@ -415,20 +414,46 @@ def prompt_server_load(entry, output_box):
     def confirm_choice():
         choice = selection.get()
         option_popup.destroy()
-        if choice == "all":
-            for route in ["flashcards", "quiz", "test"]:
-                try:
-                    res = requests.get(f"http://127.0.0.1:5000/api/{route}?topic={topic}")
-                    output_box.insert("end", f"\n{route.title()}:\n{res.text}\n")
-                except Exception as e:
-                    show_server_connection_error(route, e)
-        else:
+        routes = ["flashcards", "quiz", "test"] if choice == "all" else [choice]
+        updates = queue.Queue()  # Filled by background threads, drained on the UI thread
+        pending = {"count": len(routes)}
+
+        def follow_progress(route, progress_id):
+            try:
+                for event, data in get_client().progress_events(progress_id):
+                    updates.put(("progress", route, event))
+            except Exception as e:
+                print(f"⚠️ Progress stream for {route} ended: {e}")
+
+        def load(route):
+            # Each route gets its own progress channel, followed while the request runs
+            progress_id = uuid.uuid4().hex
+            threading.Thread(target=follow_progress, args=(route, progress_id), daemon=True).start()
             try:
-                res = requests.get(f"http://127.0.0.1:5000/api/{choice}?topic={topic}")
-                output_box.delete("1.0", "end")
-                output_box.insert("end", f"{choice.title()}:\n{res.text}")
+                updates.put(("result", route, get_client().get(route, topic=topic, progress_id=progress_id)))
             except Exception as e:
-                show_server_connection_error(choice, e)
+                updates.put(("error", route, e))
+
+        def poll():
+            while not updates.empty():
+                kind, route, value = updates.get()
+                if kind == "progress":
+                    if value not in ("complete", "generated"):
+                        output_box.insert("end", f"⏳ {route}: {value}\n")
+                elif kind == "error":
+                    pending["count"] -= 1
+                    show_server_connection_error(route, value)
+                else:
+                    pending["count"] -= 1
+                    output_box.insert("end", f"\n{route.title()}:\n{value}\n")
+            if pending["count"]:
+                output_box.after(100, poll)
+
+        if choice != "all":
+            output_box.delete("1.0", "end")
+        for route in routes:
+            threading.Thread(target=load, args=(route,), daemon=True).start()
+        poll()
 
     ctk.CTkButton(option_popup, text="Load", command=confirm_choice).pack(pady=10)
 
@@ -436,36 +461,24 @@ def prompt_server_load(entry, output_box):
 def extract_cards_from_text(text):
     global cards
     cards = []
-    blocks = text.strip().split("\n\n")
-
-    for block in blocks:
-        lines = block.strip().split("\n")
-
-        question = None
-        choices = []
-        correct = None
-
-        for line in lines:
-            if line.startswith("Q:"):
-                question = line[2:].strip()
-            elif line.startswith("A:"):
-                # Handle Q+A format with one correct answer
-                correct = line[2:].strip()
-                choices = [correct, "Incorrect 1", "Incorrect 2", "Incorrect 3"]
-                break
-            elif line.startswith("A.") or line.startswith("A:"):
-                # Handle multiple choice
-                ans_text = line[2:].strip()
-                if "✔" in ans_text:
-                    correct = ans_text.replace("✔", "").strip()
-                choices.append(ans_text.replace("✔", "").strip())
-
-        if question and correct and choices:
-            cards.append([
-                {"type": "label", "text": question},
-                {"type": "dropdown", "options": choices, "correct": correct},
-                {"type": "button", "text": "Submit"}
-            ])
+
+    for card in parse_cards(text):
+        question = card["question"]
+        correct = card["answer"]
+        if not correct:
+            continue
+        if card["options"]:
+            # Multiple choice: keep the generated options, making sure the answer is one of them
+            choices = card["options"] if correct in card["options"] else [correct] + card["options"]
+        else:
+            # Q+A format with one correct answer
+            choices = [correct, "Incorrect 1", "Incorrect 2", "Incorrect 3"]
+
+        cards.append([
+            {"type": "label", "text": question},
+            {"type": "dropdown", "options": choices, "correct": correct},
+            {"type": "button", "text": "Submit"}
+        ])
 
     return cards
 
@@ -517,25 +530,13 @@ def generate_flashcards_with_mock_answers(topic, output_box):
     generate_flashcards(topic, output_box, study_data)
 
     # Step 2: Parse flashcards into a list of {question, answer}
-    raw_text = study_data["flashcards"]
+    raw_text = study_data.get_material_text("flashcards")
     if not raw_text:
         messagebox.showerror("Error", "No flashcards were generated.")
         return
 
-    parsed_cards = []
-    blocks = raw_text.strip().split("\n\n")
-    for block in blocks:
-        lines = block.strip().splitlines()
-        q, a = None, None
-        for line in lines:
-            if line.startswith("Q:"):
-                q = line[2:].strip()
-            elif line.startswith("A:"):
-                a = line[2:].strip()
-        if q and a:
-            parsed_cards.append({"question": q, "answer": a})
-
-    cards = parsed_cards
+    cards = [{"question": card["question"], "answer": card["answer"]}
+             for card in parse_cards(raw_text) if card["question"] and card["answer"]]
 
     # Step 3: Generate distractors
     answers_dict = generate_batch_mock_answers(cards)